@@ -0,0 +1,363 @@
+import asyncio
+import contextlib
+import random
+import threading
+from urllib.parse import urlsplit
+
+import feedparser
+
+try:
+    import aiohttp
+except ImportError:  # Only needed for --engine async
+    aiohttp = None
+
+import engine
+
+# ==============================================================================
+# --- ASYNCIO ENGINE ---
+# Runs the same fetch -> scrape -> AI -> Telegram flow as engine.process_feeds, but every
+# group and source is a coroutine on one event loop. Feeds, article pages and Crossref
+# lookups go through one aiohttp session. AI and Telegram calls reuse the sync clients in
+# engine.py via asyncio.to_thread, so their retry and rate-limit policy lives in one place.
+# ==============================================================================
+
+def is_available():
+    return aiohttp is not None
+
+
+class AsyncHostScheduler:
+    """
+    Async counterpart of engine.HostScheduler for one aiohttp session, with the same per-host limits
+    and the same robots.txt cache.
+    """
+    def __init__(self, session):
+        self.session = session
+        self._hosts = {}
+
+    async def _crawl_delay(self, scheme, host):
+        record = engine.ROBOTS_CACHE.get(host)
+        if record is not None: return record['crawl_delay']
+        try:
+            async with self.session.get(f"{scheme}://{host}/robots.txt",
+                                        timeout=aiohttp.ClientTimeout(total=engine.ROBOTS_TIMEOUT)) as response:
+                robots_text = await response.text() if response.status == 200 else None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"  Could not read robots.txt of {host}: {e!r}"); return None
+        return engine.remember_robots(host, robots_text)
+
+    async def _host(self, url):
+        parts = urlsplit(url)
+        host = self._hosts.get(parts.netloc)
+        if host is None:
+            host = self._hosts[parts.netloc] = {
+                'slots': asyncio.Semaphore(engine.host_max_in_flight(parts.netloc)),
+                'lock': asyncio.Lock(), 'interval': None, 'next_start': 0.0,
+            }
+        async with host['lock']:
+            if host['interval'] is None:
+                host['interval'] = engine.host_interval(parts.netloc, await self._crawl_delay(parts.scheme, parts.netloc))
+        return host
+
+    @contextlib.asynccontextmanager
+    async def slot(self, url):
+        """Holds one of the url's host slots from the moment its turn in the host's spacing comes."""
+        host = await self._host(url)
+        async with host['slots']:
+            loop = asyncio.get_running_loop()
+            start = max(loop.time(), host['next_start'])
+            host['next_start'] = start + host['interval']
+            await asyncio.sleep(start - loop.time())
+            yield
+
+
+async def fetch_feed_async(session, url, validators, hosts):
+    """Downloads one feed with a conditional GET and parses it. A 304 gives an empty feed with status 304."""
+    headers = {}
+    if validators.get('etag'): headers['If-None-Match'] = validators['etag']
+    if validators.get('modified'): headers['If-Modified-Since'] = validators['modified']
+    async with hosts.slot(url):
+        async with session.get(url, headers=headers) as response:
+            if response.status == 304:
+                return feedparser.FeedParserDict(status=304, entries=[])
+            response.raise_for_status()
+            body = await response.read()
+    feed = feedparser.parse(body, response_headers=dict(response.headers))
+    feed['status'] = response.status
+    if response.headers.get('ETag'): feed['etag'] = response.headers['ETag']
+    if response.headers.get('Last-Modified'): feed['modified'] = response.headers['Last-Modified']
+    return feed
+
+
+async def fetch_all_feeds_async(session, sources, source_names, feed_cache, hosts):
+    """Async counterpart of engine.fetch_all_feeds, within the same per-host limits."""
+    results = await asyncio.gather(
+        *(fetch_feed_async(session, sources[name]['url'], feed_cache.get(sources[name]['url'], {}), hosts)
+          for name in source_names),
+        return_exceptions=True,
+    )
+    return dict(zip(source_names, results))
+
+
+async def _get_page(session, url, scraper, hosts):
+    """
+    Streams an article page for a page scraper in engine.SCRAPERS and returns what was read, stopping
+    early the same way as engine.read_article_body. Returns None (after printing why) if it could not be downloaded.
+    """
+    print(f"  Scraping {scraper['label']}: {url}")
+    try:
+        async with hosts.slot(url), session.get(url, timeout=aiohttp.ClientTimeout(total=scraper['timeout'])) as response:
+            response.raise_for_status()
+            stopper = engine.StreamStopper(**scraper['stream']) if scraper.get('stream') else None
+            body = bytearray()
+            async for chunk in response.content.iter_chunked(engine.STREAM_CHUNK_SIZE):
+                body += chunk
+                if len(body) >= engine.ARTICLE_MAX_BYTES:
+                    print(f"  Stopped reading after {len(body)} bytes (ARTICLE_MAX_BYTES).")
+                    break
+                if stopper and stopper.feed(body):
+                    break
+            return bytes(body)
+    except Exception as e:
+        print(f"  Error scraping {scraper['label']}: {e}")
+        return None
+
+
+async def fetch_content_via_crossref_async(session, entry, scraper, hosts):
+    """Async counterpart of engine.fetch_content_via_crossref, sharing its DOI cache."""
+    print(f"  Attempting Crossref fetch for: {entry.title}")
+    doi = engine.entry_doi(entry)
+    if not doi: print("  Could not find or extract a DOI for this entry."); return engine.scrape_result()
+    record = engine.CROSSREF_CACHE.get(doi)
+    if record is not None: print(f"  Using cached Crossref record for DOI: {doi}"); return engine.crossref_result(record)
+    print(f"  Querying Crossref with DOI: {doi}")
+    options = engine.crossref_request_options()
+    try:
+        async with hosts.slot(engine.CROSSREF_API_URL), \
+                session.get(f"{engine.CROSSREF_API_URL}/{doi}", timeout=aiohttp.ClientTimeout(total=scraper['timeout']),
+                            **options) as response:
+            if response.status == 404:
+                engine.remember_crossref_not_found(doi)
+            else:
+                response.raise_for_status()
+                engine.remember_crossref_work(doi, (await response.json(content_type=None)).get('message', {}))
+        return engine.crossref_result(engine.CROSSREF_CACHE.get(doi))
+    except Exception as e: print(f"  Error contacting Crossref API: {e}"); return engine.scrape_result()
+
+
+async def prefetch_crossref_async(session, entries, state, scraper, hosts):
+    """Async counterpart of engine.prefetch_crossref."""
+    options = engine.crossref_request_options()
+    for dois in engine.crossref_prefetch_batches(entries, state):
+        print(f"  Prefetching {len(dois)} DOIs from Crossref in one query.")
+        try:
+            async with hosts.slot(engine.CROSSREF_API_URL), \
+                    session.get(engine.CROSSREF_API_URL, params={**options['params'], **engine.crossref_batch_params(dois)},
+                                headers=options['headers'], timeout=aiohttp.ClientTimeout(total=scraper['timeout'])) as response:
+                response.raise_for_status()
+                data = await response.json(content_type=None)
+            print(f"  Crossref knew {engine.store_crossref_batch(data)} of them.")
+        except Exception as e: print(f"  Error prefetching from Crossref, falling back to single lookups: {e}")
+
+
+# source type -> coroutines used instead of the SCRAPERS fetch / prefetch functions that would block on the network.
+# They take the same arguments after the session, plus the run's AsyncHostScheduler.
+ASYNC_FETCHERS = {
+    'crossref_doi': fetch_content_via_crossref_async,
+}
+ASYNC_PREFETCHERS = {
+    'crossref_doi': prefetch_crossref_async,
+}
+
+
+async def scrape_entry_async(session, entry, source_info, limits):
+    """Async counterpart of engine.scrape_entry. Returns an engine.scrape_result, or None for an unknown type."""
+    source_type = source_info.get('type')
+    scraper = engine.SCRAPERS.get(source_type)
+    if scraper is None:
+        print(f"  No scraper registered for source type '{source_type}'.")
+        return None
+    async with limits['scrapers'].get(source_type) or contextlib.nullcontext():
+        if source_type in ASYNC_FETCHERS:
+            return await ASYNC_FETCHERS[source_type](session, entry, scraper, limits['hosts'])
+        if 'fetch' in scraper:
+            return scraper['fetch'](entry, scraper)
+        html = await _get_page(session, entry.link, scraper, limits['hosts'])
+    if html is None:
+        return engine.scrape_result()
+    try:
+        return engine.parse_article_page(scraper, entry.link, html)
+    except Exception as e:
+        print(f"  Error scraping {scraper['label']}: {e}"); return engine.scrape_result()
+
+
+async def _scrape_first_ready_async(session, source_name, source_info, candidates, pending, state, limits):
+    """
+    Async counterpart of engine.scrape_first_ready; the scrapes left over are cancelled outright.
+    The keys of every candidate but the accepted one are released.
+    """
+    async def fetch(entry, link_to_check):
+        content_data = engine.cached_content(link_to_check)
+        if content_data: return content_data, False
+        return await scrape_entry_async(session, entry, source_info, limits), True
+
+    tasks = {asyncio.ensure_future(fetch(candidate[0], candidate[1])): candidate for candidate in candidates}
+    running, handled, item = set(tasks), set(), None
+    try:
+        while running and not item:
+            done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                handled.add(task)
+                item = engine.accept_scrape(source_name, source_info, tasks[task], *task.result(), state)
+                if item: break
+    finally:
+        for task in running: task.cancel()
+        engine.release_candidates(state, candidates, item)
+    pending[:0] = [candidate[0] for task, candidate in tasks.items() if task not in handled]
+    return item
+
+
+class AIBatcher:
+    """
+    Gathers items that reach the AI stage close together, up to engine.AI_BATCH_SIZE or
+    engine.AI_BATCH_WAIT_SECONDS after the first, and runs them through engine.analyse_items as one batch.
+    """
+    def __init__(self, limit):
+        self.limit = limit  # Semaphore capping the batches analysed at once
+        self.pending = []
+        self.timer = None
+        self.tasks = set()  # Running batches; asyncio only keeps weak references to tasks
+
+    async def analyse(self, item):
+        """Returns the formatted message for item, or None."""
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((item, future))
+        if len(self.pending) >= engine.AI_BATCH_SIZE:
+            self._flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(engine.AI_BATCH_WAIT_SECONDS, self._flush)
+        return await future
+
+    def _flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, batch):
+        async with self.limit:
+            try:
+                messages = await asyncio.to_thread(engine.analyse_items, [item for item, _ in batch])
+            except Exception as e:
+                print(f"  Error during AI analysis: {e}")
+                messages = [None] * len(batch)
+        for (_, future), message in zip(batch, messages):
+            if not future.done(): future.set_result(message)
+
+
+async def _post_item(item, state, limits):
+    """AI and Telegram stages for one item. Returns True once it has been posted."""
+    item['message'] = await limits['ai'].analyse(item)
+    if not item['message']:
+        print(f"  [{item['source_name']}] Skipping post due to AI/formatting failure.")
+        return False
+
+    # One post at a time across every group, as with the sync engine's single sender.
+    async with limits['send']:
+        try:
+            image_url = item['content_data'].get('image_url')
+            if not await asyncio.to_thread(engine.send_to_telegram, item['message'], image_url=image_url):
+                return False
+            engine.record_post(item, state)
+            return True
+        except Exception as e:
+            print(f"  Error posting '{item['entry'].title}': {e}")
+            return False
+
+
+async def _process_source_async(session, source_name, source_info, feed, state, limits):
+    """Async counterpart of engine._process_source: posts at most one item from this source."""
+    print(f"--- Checking {source_name} (Type: {source_info['type']}) ---")
+    try:
+        potential_entries = engine.candidate_entries(source_name, source_info, feed, state)
+        if potential_entries is None:
+            return
+        if engine.ai_budget_spent(source_name, source_info, state):
+            return
+        source_type = source_info.get('type')
+        if source_type in ASYNC_PREFETCHERS:
+            await ASYNC_PREFETCHERS[source_type](session, potential_entries, state, engine.SCRAPERS[source_type], limits['hosts'])
+
+        pending, width = list(potential_entries), engine.speculative_width(source_info)
+        retry_later = False  # An item failed at the AI or Telegram stage, not for good
+        while True:
+            if engine.ai_budget_spent(source_name, source_info, state):
+                break
+            candidates = engine.take_candidates(source_name, pending, state, width)
+            if not candidates:
+                engine.finish_source(source_name, source_info, feed, state, retry_later)
+                break
+            item = await _scrape_first_ready_async(session, source_name, source_info, candidates, pending, state, limits)
+            if not item:
+                continue
+            posted = await _post_item(item, state, limits)
+            engine.release_keys(state, item['dedup_keys'])
+            if posted:
+                break
+            retry_later = True
+    except Exception as e:
+        print(f"!! FATAL ERROR processing feed for {source_name}. Error: {e}")
+
+
+async def process_feeds_async(session, group_name, global_index, shared, limits):
+    group = engine.load_source_group(group_name)
+    sources = group['sources']
+    feed_cache = engine.load_feed_cache(group['feed_cache_file'])
+    source_names = list(sources.keys())
+    random.shuffle(source_names)
+    feeds = await fetch_all_feeds_async(session, sources, source_names, feed_cache, limits['hosts'])
+
+    state = engine.new_group_state(group, global_index, feed_cache, claimed=shared['claimed'], lock=shared['lock'])
+    await asyncio.gather(
+        *(_process_source_async(session, name, sources[name], feeds[name], state, limits) for name in source_names)
+    )
+
+    engine.save_feed_cache(group['feed_cache_file'], feed_cache)
+    if not state['new_links_found']:
+        print(f"\n--- No new posts were made for {group_name} in this run. ---")
+
+
+async def run_groups_async(group_names):
+    """Runs every named group concurrently on one event loop, sharing one aiohttp session."""
+    global_index = engine.load_global_index()
+    shared = {'claimed': set(), 'lock': threading.Lock()}
+    limits = {
+        'ai': AIBatcher(asyncio.Semaphore(max(1, engine.PIPELINE_AI_WORKERS))),
+        'send': asyncio.Lock(),
+        'scrapers': {
+            source_type: asyncio.Semaphore(scraper['max_concurrency'])
+            for source_type, scraper in engine.SCRAPERS.items() if scraper.get('max_concurrency')
+        },
+    }
+    connector = aiohttp.TCPConnector(limit=engine.ASYNC_MAX_CONNECTIONS, limit_per_host=engine.ASYNC_MAX_CONNECTIONS_PER_HOST)
+    timeout = aiohttp.ClientTimeout(total=engine.HTTP_TIMEOUT)
+    try:
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers={'User-Agent': engine.HTTP_USER_AGENT}) as session:
+            limits['hosts'] = AsyncHostScheduler(session)
+            await asyncio.to_thread(engine.send_pending_telegram_steps)
+            results = await asyncio.gather(
+                *(process_feeds_async(session, name, global_index, shared, limits) for name in group_names),
+                return_exceptions=True,
+            )
+        for group_name, result in zip(group_names, results):
+            if isinstance(result, Exception):
+                print(f"!! FATAL ERROR running source group {group_name}. Error: {result}")
+    finally:
+        engine.save_caches()
+
+
+def run_groups(group_names):
+    asyncio.run(run_groups_async(group_names))
@@ -0,0 +1,166 @@
+"""
+Times the HTML backends used by the page scrapers in engine.SCRAPERS and checks that each
+backend extracts exactly the same content as the original full html.parser parse. Also checks
+that a streamed download which stops early (engine.read_article_body) gives the same content.
+
+    python benchmarks/bench_html_parsers.py                     # saved fixtures, or synthetic pages if none
+    python benchmarks/bench_html_parsers.py --type pubmed       # one scraper type only
+    python benchmarks/bench_html_parsers.py --save pubmed URL   # save a live page as a fixture first
+
+Fixtures live in benchmarks/fixtures/<source type>/*.html and are not committed.
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import engine  # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# source type -> its page scraper in engine.SCRAPERS
+PAGE_SCRAPERS = {source_type: scraper for source_type, scraper in engine.SCRAPERS.items() if 'body' in scraper}
+STREAM_CHUNK_SIZE = 4096  # Small chunks, so tags and comments get split across chunk boundaries
+
+
+def available_backends():
+    backends = ['html.parser']
+    if engine.lxml is not None: backends.append('lxml')
+    if engine.LexborHTMLParser is not None: backends.append('selectolax')
+    return backends
+
+
+def _paragraphs(count):
+    return '\n'.join(
+        f"<p>  Paragraph {i} with <b>bold</b>, <a href='/x{i}'>a link</a> &amp; an entity&nbsp;here.<!-- note -->\n"
+        f"   Second line <em>{'word ' * 20}</em></p>"
+        for i in range(count)
+    )
+
+
+def _page(body, paragraphs):
+    nav = '\n'.join(f"<li><a href='/section/{i}'>Section {i}</a></li>" for i in range(200))
+    return (
+        "<!DOCTYPE html><html><head><meta charset='utf-8'><title>Fixture</title>"
+        "<script>var tracking = '<p>not text</p>';</script><style>p { color: red; }</style></head><body>"
+        f"<header><nav><ul>{nav}</ul></nav></header><div class='wrapper'><div class='sidebar'>{_paragraphs(20)}</div>"
+        f"{body.format(paragraphs=_paragraphs(paragraphs))}</div><footer>{_paragraphs(10)}</footer></body></html>"
+    ).encode('utf-8')
+
+
+def synthetic_pages(paragraphs=80):
+    """Pages with the same containers as the real sites, for when no fixtures are saved."""
+    return {
+        'sciencedaily': [('https://www.sciencedaily.com/releases/x.htm', _page(
+            "<figure class='mainimg'><img src='/images/main.jpg'></figure><div id='story_text'>{paragraphs}</div>"
+            "<div id='journal_references'><a href='http://dx.doi.org/10.1000/xyz'>ref</a></div>", paragraphs))],
+        'phys_org': [('https://phys.org/news/x.html', _page(
+            "<div class='article-main'><figure class='article-img'><img src='https://phys.org/img.jpg'></figure>{paragraphs}"
+            "<div class='article-main__more'><a data-doi='1' href='https://dx.doi.org/10.1000/abc'>DOI</a></div></div>",
+            paragraphs))],
+        'full_page_scrape': [('https://www.nature.com/articles/x', _page(
+            "<div class='c-article-body main-content'>{paragraphs}</div>", paragraphs))],
+        'pubmed': [('https://pubmed.ncbi.nlm.nih.gov/1/', _page(
+            "<div class='abstract-content selected'>{paragraphs}</div>", paragraphs // 8))],
+    }
+
+
+def saved_fixtures():
+    pages = {}
+    for source_type in PAGE_SCRAPERS:
+        directory = os.path.join(FIXTURES_DIR, source_type)
+        if not os.path.isdir(directory): continue
+        for name in sorted(os.listdir(directory)):
+            if name.endswith('.html'):
+                with open(os.path.join(directory, name), 'rb') as f:
+                    pages.setdefault(source_type, []).append((f"https://fixture/{name}", f.read()))
+    return pages
+
+
+def save_fixture(source_type, url):
+    response = engine.http_get(url); response.raise_for_status()
+    directory = os.path.join(FIXTURES_DIR, source_type)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{len(os.listdir(directory)) + 1:03d}.html")
+    with open(path, 'wb') as f: f.write(response.content)
+    print(f"Saved {len(response.content)} bytes to {path}")
+
+
+@contextlib.contextmanager
+def untargeted(scraper):
+    """Temporarily disables targeted parsing, to get the original full-page html.parser result."""
+    saved = scraper['targets']
+    scraper['targets'] = None
+    try: yield
+    finally: scraper['targets'] = saved
+
+
+def ai_input(result):
+    """The part of a parse result that reaches the AI: text beyond AI_MAX_INPUT_CHARS is never sent."""
+    if isinstance(result, dict) and isinstance(result.get('text'), str):
+        return dict(result, text=result['text'][:engine.AI_MAX_INPUT_CHARS])
+    if isinstance(result, str): return result[:engine.AI_MAX_INPUT_CHARS]
+    return result
+
+
+def streamed(html, stream_spec):
+    chunks = (html[i:i + STREAM_CHUNK_SIZE] for i in range(0, len(html), STREAM_CHUNK_SIZE))
+    with contextlib.redirect_stdout(io.StringIO()):
+        return engine.read_article_body(chunks, stream_spec)
+
+
+def run_parser(scraper, url, html, backend, repeat):
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for _ in range(repeat): result = engine.parse_article_page(scraper, url, html, backend=backend)
+    return result, (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--save', nargs=2, metavar=('SOURCE_TYPE', 'URL'), help="download a page into the fixtures")
+    parser.add_argument('--type', choices=list(PAGE_SCRAPERS), help="only benchmark this scraper type")
+    parser.add_argument('--repeat', type=int, default=20, help="parses per page and backend (default 20)")
+    args = parser.parse_args()
+    if args.save:
+        if args.save[0] not in PAGE_SCRAPERS: parser.error(f"source type must be one of: {', '.join(PAGE_SCRAPERS)}")
+        save_fixture(*args.save)
+        return
+
+    pages = saved_fixtures()
+    if not pages:
+        print("No saved fixtures found; using synthetic pages.")
+        pages = synthetic_pages()
+    if args.type:
+        pages = {args.type: pages.get(args.type, [])}
+
+    mismatches = 0
+    for source_type, fixtures in pages.items():
+        scraper = PAGE_SCRAPERS[source_type]
+        for url, html in fixtures:
+            with untargeted(scraper):
+                expected, baseline = run_parser(scraper, url, html, 'html.parser', args.repeat)
+            print(f"\n{source_type} {url} ({len(html) // 1024} KiB)")
+            print(f"  {'html.parser (full page)':<26} {baseline * 1000:8.2f} ms")
+            for backend in available_backends():
+                result, elapsed = run_parser(scraper, url, html, backend, args.repeat)
+                same = result == expected
+                mismatches += not same
+                print(f"  {backend:<26} {elapsed * 1000:8.2f} ms  x{baseline / elapsed:5.1f}  {'identical' if same else 'DIFFERENT'}")
+
+            body = streamed(html, scraper['stream'])
+            result, _ = run_parser(scraper, url, body, None, 1)
+            same = ai_input(result) == ai_input(expected)
+            mismatches += not same
+            print(f"  {'streamed download':<26} {len(body) // 1024:5d} KiB read  {'identical' if same else 'DIFFERENT'}")
+
+    if mismatches:
+        print(f"\n{mismatches} result(s) differ from the full html.parser parse.")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
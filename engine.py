@@ -0,0 +1,2383 @@
+import os
+import requests
+import feedparser
+import json
+import hashlib
+import random
+from bs4 import BeautifulSoup, SoupStrainer, UnicodeDammit
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import re
+import contextlib
+import threading
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urljoin, urlparse, urlsplit, urlunsplit, parse_qsl, urlencode
+from urllib.robotparser import RobotFileParser
+from html import unescape
+
+# Optional faster HTML backends; html.parser is used when neither is installed.
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+try:
+    import lxml
+except ImportError:
+    lxml = None
+
+# ==============================================================================
+# --- 1. SCRIPT CONFIGURATION ---
+# ==============================================================================
+
+# --- AI PROVIDER SELECTION ---
+# Choose your AI provider here. Options: 'gemini' or 'groq'
+AI_PROVIDER = 'gemini' 
+# Tried in order after AI_PROVIDER when it fails or its circuit is open. Providers without an API key are left out.
+AI_FALLBACK_PROVIDERS = ['groq']
+AI_CIRCUIT_FAILURE_THRESHOLD = 3    # Failed calls in a row (after retries) that open a provider's circuit
+AI_CIRCUIT_COOLDOWN_SECONDS = 300   # How long an open circuit skips its provider before one trial call
+
+# --- GITHUB SECRETS & API KEYS ---
+# Make sure to set these in your environment variables
+TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
+TELEGRAM_CHANNEL_ID = os.getenv('TELEGRAM_CHANNEL_ID')
+GROQ_API_KEY = os.getenv('GROQ_API_KEY') # Renamed from OPENROUTER_API_KEY for clarity
+GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+
+# --- GROQ CONFIGURATION ---
+GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+GROQ_MODEL = "llama3-70b-8192" # A powerful and common model on Groq
+YOUR_SITE_URL = "https://github.com/SangeRooYakh/MokhberAi" # For Groq/OpenRouter headers
+YOUR_APP_NAME = "Farsi Science News by AI"             # For Groq/OpenRouter headers
+
+# --- GEMINI CONFIGURATION ---
+# Note: Gemini 2.5 Pro does not exist. Use 'gemini-1.5-pro-latest' or 'gemini-1.5-flash-latest'
+GEMINI_MODEL = "gemini-2.5-flash"
+
+# --- AI INPUT PREPARATION ---
+# Article text is cleaned (boilerplate and repeated paragraphs dropped) and then fitted, from the top,
+# to the provider's token budget, so the abstract and lead paragraphs always make it into the prompt.
+AI_MAX_INPUT_CHARS = 30000   # Raw article text considered at all
+AI_INPUT_TOKEN_BUDGET = {'gemini': 4000, 'groq': 3000}  # Estimated article tokens per prompt (Groq's model has an 8k context)
+# Paragraphs shaped like this are page furniture, not article text: a labelled footer ("Citation: ..."),
+# a bare section heading, or the copyright notice.
+AI_BOILERPLATE_PATTERN = re.compile(
+    r"(story source|journal references?|more information|journal information|citation|editor'?s note)\s*:"
+    r"|(explore further|rights and permissions|reprints and permissions)\s*$"
+    r"|this document is subject to copyright\b",
+    re.IGNORECASE,
+)
+# Figure captions ("Fig. 2 | ...", "Figure 2: ...") and "Provided by ..." credits, up to this length.
+AI_CAPTION_PATTERN = re.compile(r"fig(ure|\.)\s*\d+[a-z]?\s*[|:]|provided by\b", re.IGNORECASE)
+AI_CAPTION_MAX_CHARS = 800
+AI_REFERENCE_PATTERN = re.compile(r'\bdoi:\s*10\.|doi\.org/10\.|google scholar|pubmed central', re.IGNORECASE)
+
+# --- AI RATE LIMITS & RETRIES ---
+# Calls per minute allowed for each provider's model (the free-tier limits); one bucket per provider and model.
+AI_REQUESTS_PER_MINUTE = {'gemini': 10, 'groq': 30}
+AI_RATE_BURST = 2              # Calls that may go out back to back before the rate applies
+AI_RETRY_STATUSES = {429, 500, 502, 503, 504}
+AI_MAX_RETRIES = 4             # Retries per call after a 429/5xx answer or a connection error
+AI_RETRY_BASE_DELAY = 2.0      # Seconds; doubles with every retry, with full jitter. Retry-After wins when longer
+AI_RETRY_MAX_DELAY = 60.0
+# Total seconds all AI calls of one run may take, including rate-limit waits and backoff.
+# Once it is spent, remaining items are skipped and retried on the next run.
+AI_TIME_BUDGET_SECONDS = int(os.getenv('AI_TIME_BUDGET_SECONDS', '900'))
+
+# --- AI RESPONSE STREAMING ---
+# Answers are streamed and their JSON checked as it arrives: malformed output is dropped at its first bad
+# character, and a slow but steady answer is not cut off by a fixed timeout. A call's timeout then bounds
+# the wait for each chunk, and AI_STREAM_MAX_SECONDS the whole answer. Set AI_STREAM_RESPONSES=0 to turn it off.
+AI_STREAM_RESPONSES = os.getenv('AI_STREAM_RESPONSES', '1') != '0'
+AI_STREAM_MAX_SECONDS = 240
+
+# --- BATCHED AI ANALYSIS ---
+# Items reaching the AI stage together are analysed in one request per post format, saving round trips and quota.
+AI_BATCH_SIZE = int(os.getenv('AI_BATCH_SIZE', '4'))   # Articles per request at most (1 turns batching off)
+AI_BATCH_WAIT_SECONDS = 2.0   # How long the AI stage waits for more items before sending a partial batch
+AI_BATCH_TIMEOUT = 120        # Seconds per batched request; answers are several times longer than single ones
+# Estimated article tokens per batched request for each provider, within its model's context window.
+AI_BATCH_MAX_INPUT_TOKENS = {'gemini': 16000, 'groq': 3000}
+
+# --- TELEGRAM SENDING ---
+# Telegram lets a bot post about 20 messages a minute to one channel; calls are spaced to stay under that.
+# A 429 answer's retry_after is waited out and the same call sent again, so a burst of posts is delayed, not lost.
+TELEGRAM_MESSAGES_PER_MINUTE = 20
+TELEGRAM_RATE_BURST = 3
+TELEGRAM_MAX_RETRIES = 5      # Retries per call after a 429, a 5xx answer or a failed connection
+TELEGRAM_MAX_WAIT = 300       # Longest single wait (rate limit or retry_after) before a post is left for the next run
+# A post goes out in as few calls as fit: one captioned photo when the whole text fits the caption,
+# otherwise the text split at paragraph, line or word breaks. Limits count visible characters, as Telegram does.
+TELEGRAM_CAPTION_LIMIT = 1024
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+# --- SOURCE GROUPS ---
+# Each sources/<group>.json holds one group's SOURCES plus the files that track its history.
+# File names inside a group are relative to the repository root.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCES_DIR = os.path.join(BASE_DIR, 'sources')
+# A group's feed_cache_file keeps the ETag/Last-Modified validators per feed URL.
+# They are sent back on the next run so unchanged feeds answer with a cheap 304.
+
+# --- POSTED LINKS STORE ---
+# A group's posted_links_file is append-only: one "link<TAB>YYYY-MM-DD" line per post.
+# Entries older than this many days are dropped when the file is next loaded (0 = keep forever).
+POSTED_LINKS_MAX_AGE_DAYS = int(os.getenv('POSTED_LINKS_MAX_AGE_DAYS', '0'))
+# Shared by all groups, in the same format: one "url:<canonical url>" and/or "doi:<doi>" key per line.
+# An article whose URL or DOI is already here is skipped by every group before it is scraped.
+GLOBAL_INDEX_FILE = os.path.join(BASE_DIR, 'posted_index.txt')
+
+# --- URL CANONICALIZATION ---
+# Query parameters that only track where a click came from and never change the article.
+TRACKING_QUERY_PARAMS = {'fbclid', 'gclid', 'mc_cid', 'mc_eid'}
+TRACKING_QUERY_PREFIXES = ('utm_',)
+# Extra per-host tracking parameters (PubMed RSS links carry fc/ff/v run stamps, science.org adds af=R).
+HOST_TRACKING_QUERY_PARAMS = {
+    'pubmed.ncbi.nlm.nih.gov': {'fc', 'ff', 'v'},
+    'science.org': {'af'},
+}
+DOI_PATTERN = re.compile(r'(10\.\d{4,9}/[-._;()/:A-Z0-9]+)', re.IGNORECASE)
+
+# --- LOCAL CACHES ---
+# Caches that only speed things up live here and are not committed (the workflow keeps them with actions/cache).
+CACHE_DIR = os.getenv('BOT_CACHE_DIR', os.path.join(BASE_DIR, '.cache'))
+# Scraped article content (text, image_url, doi_link) per canonical URL, so a retry after
+# an AI failure goes straight to the AI step without downloading the article again.
+CONTENT_CACHE_FILE = os.path.join(CACHE_DIR, 'content_cache.json')
+CONTENT_CACHE_TTL_HOURS = float(os.getenv('CONTENT_CACHE_TTL_HOURS', '48'))
+# Parsed AI responses keyed by provider, model, prompt template version and a hash of the text,
+# so re-analysing the same article after a Telegram failure or a crash costs no tokens.
+LLM_CACHE_FILE = os.path.join(CACHE_DIR, 'llm_cache.json')
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '500'))  # Oldest entries are evicted beyond this
+# Bump a version whenever its prompt template changes, so stale cached answers are not reused.
+PAPER_PROMPT_VERSION = 1
+NEWS_PROMPT_VERSION = 1
+# Telegram file_id per image URL, so an image Telegram already has is sent again without another upload.
+TELEGRAM_FILE_ID_CACHE_FILE = os.path.join(CACHE_DIR, 'telegram_file_ids.json')
+TELEGRAM_FILE_ID_CACHE_TTL_DAYS = 90
+# Calls still owed for posts that went out only in part (e.g. the photo but not its continuation),
+# sent before the next post (or at the start of the next run); the whole post is never sent again.
+TELEGRAM_PENDING_FILE = os.path.join(CACHE_DIR, 'telegram_pending.json')
+TELEGRAM_PENDING_TTL_HOURS = 48
+
+# --- CROSSREF CLIENT ---
+# Crossref serves clients that give a contact address from its faster "polite" pool.
+CROSSREF_API_URL = "https://api.crossref.org/works"
+CROSSREF_MAILTO = os.getenv('CROSSREF_MAILTO')  # Contact address for the polite pool; anonymous pool when unset
+CROSSREF_BATCH_SIZE = 40  # DOIs looked up per filtered /works query when prefetching a feed
+# Crossref answers per DOI, so an entry seen again on a later run needs no request.
+CROSSREF_CACHE_FILE = os.path.join(CACHE_DIR, 'crossref_cache.json')
+CROSSREF_CACHE_TTL_DAYS = float(os.getenv('CROSSREF_CACHE_TTL_DAYS', '30'))
+# DOIs Crossref does not know (404) are retried after this long; they are often registered a little later.
+CROSSREF_NOT_FOUND_TTL_HOURS = float(os.getenv('CROSSREF_NOT_FOUND_TTL_HOURS', '24'))
+
+# --- CANDIDATE SCORING ---
+# A source's newest entries are tried in order of how likely they are to give a usable article,
+# judged from the feed entry itself and the source's scrape history, so fewer downloads are wasted.
+CANDIDATE_POOL_SIZE = 20            # Newest feed entries considered per source
+CANDIDATE_SCORE_JITTER = 0.3        # Random spread added to scores, so close candidates still rotate between runs
+SCRAPE_HISTORY_FILE = os.path.join(CACHE_DIR, 'scrape_history.json')
+SCRAPE_HISTORY_TTL_DAYS = 14        # How long a source's per-host scrape counts are kept after their last update
+SCRAPE_FAILED_LINK_TTL_HOURS = 24   # A link whose scrape failed is tried last for this long
+
+# --- PER-HOST POLITENESS ---
+# Feed downloads, article pages and Crossref lookups to one host share its limits, whichever source, group
+# or engine they come from: a cap on requests in flight and a minimum spacing between their starts.
+# A host's robots.txt Crawl-delay (or Request-rate) lengthens the spacing; it is read once and cached.
+HOST_MAX_IN_FLIGHT = int(os.getenv('HOST_MAX_IN_FLIGHT', '2'))      # Requests in flight per host
+HOST_MIN_INTERVAL = float(os.getenv('HOST_MIN_INTERVAL', '0.5'))    # Seconds between request starts to one host
+HOST_MAX_CRAWL_DELAY = 20.0   # Longer robots.txt delays are capped, so one host cannot stall a run
+# Hosts that need other limits ('max_in_flight', 'min_interval'), such as APIs that publish their own.
+HOST_LIMITS = {
+    'api.crossref.org': {'max_in_flight': 4, 'min_interval': 0.0},
+}
+ROBOTS_CACHE_FILE = os.path.join(CACHE_DIR, 'robots_cache.json')
+ROBOTS_CACHE_TTL_HOURS = 24
+ROBOTS_TIMEOUT = 10
+
+# --- FEED FETCHING CONFIGURATION ---
+# All feeds are downloaded up front, in parallel, before any source is processed.
+FEED_FETCH_MAX_WORKERS = int(os.getenv('FEED_FETCH_MAX_WORKERS', '8'))   # Total feeds in flight at once
+
+# --- PIPELINE CONFIGURATION ---
+# Within a group, sources flow through scrape -> AI -> Telegram stages that run at the same time.
+PIPELINE_SCRAPE_WORKERS = int(os.getenv('PIPELINE_SCRAPE_WORKERS', '4'))  # Sources scraped at once
+PIPELINE_AI_WORKERS = int(os.getenv('PIPELINE_AI_WORKERS', '2'))          # AI analyses in flight at once
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', '4'))          # Items waiting between two stages
+# Each source scrapes its best few unposted entries at once; the first usable one goes on to the AI stage
+# and the other scrapes are cancelled. Capped by the scraper's max_concurrency. 1 scrapes one at a time.
+SPECULATIVE_SCRAPES = int(os.getenv('SPECULATIVE_SCRAPES', '2'))
+
+# --- ASYNC ENGINE CONFIGURATION ---
+# Used by async_engine.py (run.py --engine async), which needs the optional aiohttp package.
+# All groups and sources run as coroutines on one event loop; these cap its open connections.
+ASYNC_MAX_CONNECTIONS = int(os.getenv('ASYNC_MAX_CONNECTIONS', '16'))          # Connections open at once
+ASYNC_MAX_CONNECTIONS_PER_HOST = int(os.getenv('ASYNC_MAX_CONNECTIONS_PER_HOST', '2'))  # ... to one host
+
+# --- HTML PARSING ---
+# Backend for article pages: 'selectolax', 'lxml', 'html.parser', or 'auto' for the fastest one installed.
+# Well-formed pages give identical text with every backend; broken markup is repaired differently by each.
+# benchmarks/bench_html_parsers.py times them and checks they extract identical text from saved pages.
+HTML_PARSER = os.getenv('HTML_PARSER', 'auto')
+
+# --- STREAMED ARTICLE DOWNLOADS ---
+# Article pages are read in chunks and the download stops as soon as the parser has what it needs.
+ARTICLE_MAX_BYTES = int(os.getenv('ARTICLE_MAX_BYTES', str(3 * 1024 * 1024)))  # Never read more of one page than this
+STREAM_CHUNK_SIZE = 64 * 1024
+# Stop once the article text container holds this much text. Kept well above AI_MAX_INPUT_CHARS
+# because captions, whitespace and entities inside the container are counted too.
+STREAM_TEXT_TARGET_CHARS = 2 * AI_MAX_INPUT_CHARS
+
+# --- HTTP CLIENT CONFIGURATION ---
+# Every scraper, Crossref, AI and Telegram call goes through one pooled keep-alive session.
+HTTP_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36'
+HTTP_TIMEOUT = 20            # Default seconds per request when a call does not pass its own timeout
+HTTP_RETRIES = 2             # Retries for idempotent requests on connection errors and 5xx/429 answers
+HTTP_RETRY_BACKOFF = 0.5     # Seconds; doubles with every retry
+HTTP_POOL_MAXSIZE = 10       # Keep-alive connections kept open per host
+# Hosts that need a different pool size than HTTP_POOL_MAXSIZE.
+HTTP_HOST_POOL_SIZES = {
+    'api.telegram.org': 2,
+    'api.crossref.org': 4,
+    'api.groq.com': 2,
+    'generativelanguage.googleapis.com': 2,
+}
+
+# ==============================================================================
+# --- 2. SHARED HTTP CLIENT ---
+# ==============================================================================
+class CappedRetry(Retry):
+    """urllib3 Retry that waits at most HTTP_TIMEOUT seconds for a server's Retry-After."""
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        return None if retry_after is None else min(retry_after, HTTP_TIMEOUT)
+
+def build_http_session():
+    """
+    Creates the requests.Session shared by every HTTP call in this script.
+    Connections are kept alive and pooled per host; idempotent requests are retried
+    with exponential backoff, waiting out a Retry-After of at most HTTP_TIMEOUT seconds.
+    POSTs are never retried here.
+    """
+    session = requests.Session()
+    session.headers['User-Agent'] = HTTP_USER_AGENT
+
+    def make_adapter(pool_size):
+        retry = CappedRetry(
+            total=HTTP_RETRIES,
+            backoff_factor=HTTP_RETRY_BACKOFF,
+            status_forcelist=(429, 500, 502, 503, 504),
+            raise_on_status=False,
+        )
+        return HTTPAdapter(pool_connections=20, pool_maxsize=pool_size, max_retries=retry)
+
+    session.mount('http://', make_adapter(HTTP_POOL_MAXSIZE))
+    session.mount('https://', make_adapter(HTTP_POOL_MAXSIZE))
+    for host, pool_size in HTTP_HOST_POOL_SIZES.items():
+        session.mount(f'https://{host}/', make_adapter(pool_size))
+    return session
+
+HTTP_SESSION = build_http_session()
+
+def http_get(url, **kwargs):
+    kwargs.setdefault('timeout', HTTP_TIMEOUT)
+    return HTTP_SESSION.get(url, **kwargs)
+
+def http_post(url, **kwargs):
+    kwargs.setdefault('timeout', HTTP_TIMEOUT)
+    return HTTP_SESSION.post(url, **kwargs)
+
+# ==============================================================================
+# --- Utility & Fetching Functions (Unchanged) ---
+# ==============================================================================
+def _today():
+    return datetime.now(timezone.utc).date().isoformat()
+
+def load_posted_links(posted_links_file):
+    """
+    Reads posted_links_file into a set for O(1) membership checks.
+    The file is only rewritten when it needs compacting: legacy lines without a date
+    (the old one-link-per-line format) are migrated and stamped with today's date,
+    and entries older than POSTED_LINKS_MAX_AGE_DAYS are expired.
+    """
+    entries = {}
+    needs_compaction = False
+    try:
+        with open(posted_links_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line: continue
+                link, sep, posted_on = line.partition('\t')
+                if not sep:
+                    posted_on = _today()
+                    needs_compaction = True
+                if link in entries: needs_compaction = True
+                entries.setdefault(link, posted_on)
+    except FileNotFoundError: return set()
+
+    if POSTED_LINKS_MAX_AGE_DAYS > 0:
+        cutoff = (datetime.now(timezone.utc).date() - timedelta(days=POSTED_LINKS_MAX_AGE_DAYS)).isoformat()
+        expired = [link for link, posted_on in entries.items() if posted_on < cutoff]
+        for link in expired: del entries[link]
+        if expired:
+            print(f"Expiring {len(expired)} posted links older than {POSTED_LINKS_MAX_AGE_DAYS} days.")
+            needs_compaction = True
+
+    if needs_compaction:
+        tmp_file = posted_links_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            for link, posted_on in entries.items(): f.write(f"{link}\t{posted_on}\n")
+        os.replace(tmp_file, posted_links_file)
+    return set(entries)
+
+def append_posted_link(posted_links_file, link):
+    """Records a single posted link at the end of posted_links_file."""
+    with open(posted_links_file, 'a', encoding='utf-8') as f:
+        f.write(f"{link}\t{_today()}\n")
+
+def canonical_url(url):
+    """
+    Normalizes a link for dedup. The scheme is always https, the host is lowercased
+    without 'www.' or a default port, tracking query parameters, the fragment and any
+    trailing slash are dropped, and the remaining query parameters are sorted.
+    """
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or '').lower()
+    if host.startswith('www.'): host = host[4:]
+    netloc = host if parts.port in (None, 80, 443) else f"{host}:{parts.port}"
+    host_params = HOST_TRACKING_QUERY_PARAMS.get(host, set())
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_QUERY_PARAMS and key.lower() not in host_params
+        and not key.lower().startswith(TRACKING_QUERY_PREFIXES)
+    )
+    path = parts.path.rstrip('/')
+    return urlunsplit(('https', netloc, path, urlencode(query), ''))
+
+def normalize_doi(doi):
+    """Strips doi.org / 'doi:' prefixes and lowercases a DOI. Returns None if it isn't one."""
+    doi = re.sub(r'^(https?://(dx\.)?doi\.org/|doi:)', '', doi.strip(), flags=re.IGNORECASE).lower()
+    return doi if doi.startswith('10.') else None
+
+def link_doi(link):
+    """Extracts a DOI from an article link, if it contains one or is a nature.com article."""
+    match = DOI_PATTERN.search(link)
+    if match: return normalize_doi(match.group(0))
+    parts = urlsplit(link)
+    if (parts.hostname or '').endswith('nature.com') and parts.path.startswith('/articles/'):
+        return normalize_doi('10.1038/' + parts.path[len('/articles/'):].strip('/'))
+    return None
+
+def entry_doi(entry):
+    """Returns the DOI of a feed entry: from its metadata if declared, otherwise from its link."""
+    for field in ('dc_identifier', 'prism_doi'):
+        if entry.get(field):
+            doi = normalize_doi(entry.get(field))
+            if doi: return doi
+    return link_doi(entry.get('link', ''))
+
+def dedup_keys(link, doi=None):
+    """Returns the global index keys for an article: its canonical URL and, if known, its DOI."""
+    keys = [f"url:{canonical_url(link)}"]
+    doi = normalize_doi(doi) if doi else None
+    if doi: keys.append(f"doi:{doi}")
+    return keys
+
+def load_global_index():
+    """
+    Loads GLOBAL_INDEX_FILE. The first time it is created, it is seeded with the
+    posted links of every source group so nothing already posted is picked up again.
+    URL keys are re-canonicalized on load, so older entries still match if the rules change.
+    """
+    seed = not os.path.exists(GLOBAL_INDEX_FILE)
+    global_index = {
+        f"url:{canonical_url(key[4:])}" if key.startswith('url:') else key
+        for key in load_posted_links(GLOBAL_INDEX_FILE)
+    }
+    if seed:
+        print("Seeding the global dedup index from every group's posted links...")
+        for group_name in list_source_groups():
+            group = load_source_group(group_name)
+            for link in load_posted_links(group['posted_links_file']):
+                record_dedup_keys(global_index, dedup_keys(link, link_doi(link)))
+    return global_index
+
+def record_dedup_keys(global_index, keys):
+    for key in keys:
+        if key not in global_index:
+            global_index.add(key)
+            append_posted_link(GLOBAL_INDEX_FILE, key)
+
+def load_feed_cache(feed_cache_file):
+    try:
+        with open(feed_cache_file, 'r', encoding='utf-8') as f: return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError): return {}
+
+def save_feed_cache(feed_cache_file, cache):
+    with open(feed_cache_file, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+
+class JsonFileCache:
+    """
+    A small on-disk cache kept in one JSON file as key -> {'stored_at', 'value'}.
+    The file is read on first use and written by save() only if something changed.
+    Entries older than ttl_seconds are treated as missing and dropped, and when there
+    are more than max_entries the oldest ones are evicted on save.
+    """
+    def __init__(self, path, ttl_seconds=None, max_entries=None):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f: self._entries = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError): self._entries = {}
+            expired = [key for key, item in self._entries.items() if self._is_expired(item)]
+            for key in expired: del self._entries[key]
+            self._dirty = bool(expired)
+        return self._entries
+
+    def _is_expired(self, item):
+        ttl_seconds = item.get('ttl', self.ttl_seconds)
+        return ttl_seconds is not None and time.time() - item['stored_at'] > ttl_seconds
+
+    def get(self, key):
+        with self._lock:
+            item = self._load().get(key)
+            if item is None or self._is_expired(item): return None
+            return item['value']
+
+    def set(self, key, value, ttl_seconds=None):
+        """Stores value; ttl_seconds overrides the cache's TTL for this entry only."""
+        with self._lock:
+            item = {'stored_at': time.time(), 'value': value}
+            if ttl_seconds is not None: item['ttl'] = ttl_seconds
+            self._load()[key] = item
+            self._dirty = True
+
+    def keys(self):
+        """Keys of the entries that have not expired, oldest first."""
+        with self._lock:
+            entries = self._load()
+            return [key for key in sorted(entries, key=lambda key: entries[key]['stored_at'])
+                    if not self._is_expired(entries[key])]
+
+    def delete(self, key):
+        with self._lock:
+            if self._load().pop(key, None) is not None: self._dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self._dirty: return
+            if self.max_entries is not None and len(self._entries) > self.max_entries:
+                newest = sorted(self._entries.items(), key=lambda item: item[1]['stored_at'])[-self.max_entries:]
+                self._entries = dict(newest)
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_file = self.path + '.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f: json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(tmp_file, self.path)
+            self._dirty = False
+
+CONTENT_CACHE = JsonFileCache(CONTENT_CACHE_FILE, ttl_seconds=CONTENT_CACHE_TTL_HOURS * 3600)
+LLM_CACHE = JsonFileCache(LLM_CACHE_FILE, max_entries=LLM_CACHE_MAX_ENTRIES)
+CROSSREF_CACHE = JsonFileCache(CROSSREF_CACHE_FILE, ttl_seconds=CROSSREF_CACHE_TTL_DAYS * 86400)
+SCRAPE_HISTORY = JsonFileCache(SCRAPE_HISTORY_FILE, ttl_seconds=SCRAPE_HISTORY_TTL_DAYS * 86400, max_entries=5000)
+ROBOTS_CACHE = JsonFileCache(ROBOTS_CACHE_FILE, ttl_seconds=ROBOTS_CACHE_TTL_HOURS * 3600)
+TELEGRAM_FILE_IDS = JsonFileCache(TELEGRAM_FILE_ID_CACHE_FILE, ttl_seconds=TELEGRAM_FILE_ID_CACHE_TTL_DAYS * 86400, max_entries=1000)
+TELEGRAM_PENDING = JsonFileCache(TELEGRAM_PENDING_FILE, ttl_seconds=TELEGRAM_PENDING_TTL_HOURS * 3600)
+
+# --- Per-host politeness: caps and spacing per host, from HOST_LIMITS and robots.txt. Shared by both engines. ---
+
+def robots_delay(robots_text):
+    """Seconds a robots.txt asks every crawler to leave between requests (Crawl-delay or Request-rate), or None."""
+    parser = RobotFileParser()
+    parser.parse(robots_text.splitlines())
+    delay = parser.crawl_delay('*')
+    rate = parser.request_rate('*')
+    if rate and rate.requests: delay = max(delay or 0, rate.seconds / rate.requests)
+    return float(delay) if delay else None
+
+def remember_robots(host, robots_text):
+    """Caches the delay from a host's robots.txt (robots_text None if it has none). Returns the delay."""
+    delay = robots_delay(robots_text) if robots_text else None
+    ROBOTS_CACHE.set(host, {'crawl_delay': delay})
+    if delay: print(f"  robots.txt of {host} asks for {delay:g}s between requests.")
+    return delay
+
+def host_max_in_flight(host):
+    return max(1, HOST_LIMITS.get(host, {}).get('max_in_flight', HOST_MAX_IN_FLIGHT))
+
+def host_interval(host, crawl_delay):
+    """Minimum seconds between request starts to host, given its robots.txt delay."""
+    min_interval = HOST_LIMITS.get(host, {}).get('min_interval', HOST_MIN_INTERVAL)
+    return max(min_interval, min(crawl_delay or 0, HOST_MAX_CRAWL_DELAY))
+
+def fetch_crawl_delay(scheme, host):
+    """The host's robots.txt delay, from ROBOTS_CACHE or downloaded. A failed download is not cached."""
+    record = ROBOTS_CACHE.get(host)
+    if record is not None: return record['crawl_delay']
+    try:
+        response = http_get(f"{scheme}://{host}/robots.txt", timeout=ROBOTS_TIMEOUT)
+    except requests.exceptions.RequestException as e:
+        print(f"  Could not read robots.txt of {host}: {e}"); return None
+    return remember_robots(host, response.text if response.status_code == 200 else None)
+
+class HostScheduler:
+    """
+    Per-host politeness for the sync engine's threads: at most host_max_in_flight requests to a
+    host at once, with their starts spaced by host_interval. robots.txt is read on a host's first use.
+    """
+    def __init__(self):
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _host(self, url):
+        parts = urlsplit(url)
+        with self._lock:
+            host = self._hosts.get(parts.netloc)
+            if host is None:
+                host = self._hosts[parts.netloc] = {
+                    'slots': threading.BoundedSemaphore(host_max_in_flight(parts.netloc)),
+                    'lock': threading.Lock(), 'interval': None, 'next_start': 0.0,
+                }
+        with host['lock']:
+            if host['interval'] is None:
+                host['interval'] = host_interval(parts.netloc, fetch_crawl_delay(parts.scheme, parts.netloc))
+        return host
+
+    @contextlib.contextmanager
+    def slot(self, url):
+        """Holds one of the url's host slots from the moment its turn in the host's spacing comes."""
+        host = self._host(url)
+        with host['slots']:
+            with host['lock']:
+                now = time.monotonic()
+                start = max(now, host['next_start'])
+                host['next_start'] = start + host['interval']
+            if start > now: time.sleep(start - now)
+            yield
+
+HOST_SCHEDULER = HostScheduler()
+
+def remember_feed_validators(feed_cache, url, feed):
+    """Stores the ETag/Last-Modified a feed was served with, for the next run's conditional GET."""
+    validators = {}
+    if feed.get('etag'): validators['etag'] = feed.get('etag')
+    if feed.get('modified'): validators['modified'] = feed.get('modified')
+    if validators: feed_cache[url] = validators
+    else: feed_cache.pop(url, None)
+
+def _fetch_feed(url, validators):
+    """Downloads and parses a single feed, holding a HOST_SCHEDULER slot while doing so."""
+    with HOST_SCHEDULER.slot(url):
+        return feedparser.parse(url, etag=validators.get('etag'), modified=validators.get('modified'))
+
+def fetch_all_feeds(sources, source_names, feed_cache):
+    """
+    Downloads the feed of every source in source_names concurrently.
+    At most FEED_FETCH_MAX_WORKERS feeds are fetched at once, within each host's HOST_SCHEDULER limits.
+    Validators from feed_cache are sent along, so unchanged feeds come back with status 304.
+    Returns a dict of source_name -> parsed feed, or the exception the fetch raised.
+    """
+    print(f"--- Fetching {len(source_names)} feeds (max {FEED_FETCH_MAX_WORKERS} at once) ---")
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, FEED_FETCH_MAX_WORKERS)) as executor:
+        futures = {
+            name: executor.submit(_fetch_feed, sources[name]['url'], feed_cache.get(sources[name]['url'], {}))
+            for name in source_names
+        }
+        for source_name, future in futures.items():
+            try:
+                results[source_name] = future.result()
+            except Exception as e:
+                results[source_name] = e
+    return results
+
+# --- HTML backends: one small interface over selectolax and BeautifulSoup (lxml / html.parser). ---
+
+class _SoupNode:
+    def __init__(self, tag): self._tag = tag
+    def select_one(self, css):
+        tag = self._tag.select_one(css)
+        return _SoupNode(tag) if tag is not None else None
+    def select(self, css): return [_SoupNode(tag) for tag in self._tag.select(css)]
+    def attr(self, name): return self._tag.get(name)
+    def text(self, separator=''): return self._tag.get_text(separator=separator, strip=True)
+    def remove(self, css):
+        for tag in self._tag.select(css): tag.decompose()
+
+class _LexborNode:
+    # BeautifulSoup's get_text() leaves out the contents of these tags, so this does too.
+    SKIPPED_TEXT_PARENTS = ('script', 'style', 'template')
+
+    def __init__(self, node): self._node = node
+    def select_one(self, css):
+        node = self._node.css_first(css)
+        return _LexborNode(node) if node is not None else None
+    def select(self, css): return [_LexborNode(node) for node in self._node.css(css)]
+    def attr(self, name): return self._node.attributes.get(name)
+    def remove(self, css):
+        for node in self._node.css(css): node.decompose()
+    def text(self, separator=''):
+        """Same result as BeautifulSoup's get_text(separator=separator, strip=True)."""
+        parts = []
+        for node in self._node.traverse(include_text=True):
+            if node.is_text_node and node.parent.tag not in self.SKIPPED_TEXT_PARENTS:
+                part = node.text_content.strip()
+                if part: parts.append(part)
+        return separator.join(parts)
+
+def html_backend():
+    """Resolves HTML_PARSER ('auto' picks the fastest installed backend)."""
+    if HTML_PARSER != 'auto': return HTML_PARSER
+    if LexborHTMLParser is not None: return 'selectolax'
+    if lxml is not None: return 'lxml'
+    return 'html.parser'
+
+def parse_html(html, targets=None, backend=None):
+    """
+    Parses a page with the chosen backend and returns its root node.
+    targets (a list of SoupStrainer keyword dicts) limits the BeautifulSoup backends to
+    building only the containers a parser reads; selectolax always parses the whole page.
+    """
+    backend = backend or html_backend()
+    if backend == 'selectolax':
+        if isinstance(html, bytes):
+            try: html = html.decode('utf-8')
+            except UnicodeDecodeError: html = UnicodeDammit(html).unicode_markup
+        return _LexborNode(LexborHTMLParser(html).root)
+    parse_only = None
+    if targets and len(targets) == 1:
+        target = dict(targets[0])
+        parse_only = SoupStrainer(target.pop('name'), **target)
+    elif targets:
+        # Different attributes can't be combined in one SoupStrainer; keep every tag with a wanted name instead.
+        parse_only = SoupStrainer([target['name'] for target in targets])
+    return _SoupNode(BeautifulSoup(html, backend, parse_only=parse_only))
+
+# --- Page parsers: turn downloaded HTML into content. Shared by the sync and async engines. ---
+
+def _class_pattern(*class_names):
+    """Matches a class attribute that contains any of class_names (SoupStrainer sees the raw attribute string)."""
+    return re.compile(r'(^|\s)(' + '|'.join(re.escape(name) for name in class_names) + r')(\s|$)')
+
+def scrape_result(text=None, image_url=None, doi_link=None):
+    """The one result shape every scraper returns, and the content cache stores."""
+    return {'text': text, 'image_url': image_url, 'doi_link': doi_link}
+
+def parse_article_page(scraper, url, html, backend=None):
+    """Extracts text, an image and a DOI link from a downloaded page, following a page scraper's rules in SCRAPERS."""
+    soup = parse_html(html, scraper.get('targets'), backend)
+    article_body = None
+    for css in scraper['body']:
+        article_body = soup.select_one(css)
+        if article_body: break
+    if not article_body: print(f"  Could not find the {scraper['label']} body. Scraping failed."); return scrape_result()
+
+    image_url = None
+    image_tag = soup.select_one(scraper['image']) if scraper.get('image') else None
+    if image_tag and image_tag.attr('src') is not None: image_url = urljoin(url, image_tag.attr('src'))
+
+    doi_link = None
+    doi_tag = soup.select_one(scraper['doi']) if scraper.get('doi') else None
+    if doi_tag and doi_tag.attr('href') is not None: doi_link = doi_tag.attr('href')
+
+    if scraper.get('skip'): article_body.remove(scraper['skip'])
+    if scraper.get('text'): full_text = '\n\n'.join(node.text() for node in article_body.select(scraper['text']))
+    else: full_text = article_body.text(separator=' ')
+
+    print(f"  Scraped: {len(full_text)} chars, Image: {'Yes' if image_url else 'No'}, DOI: {'Yes' if doi_link else 'No'}")
+    return scrape_result(full_text, image_url, doi_link)
+
+# --- Streamed article downloads: stop reading once the parser has everything it needs. ---
+
+class StreamStopper:
+    """
+    Scans an article page while it downloads and tells the reader when the rest can be skipped:
+    once every container in `containers` has closed, or `text_container` holds at least
+    STREAM_TEXT_TARGET_CHARS of text and nothing else is pending. Containers are
+    (tag, attribute, value) triples, e.g. ('div', 'class', 'article-main').
+    Only tags are scanned, with one regex, so this costs far less than parsing the page.
+    """
+    _TOKEN = re.compile(
+        rb'<!--.*?-->|<(script|style)\b.*?</\1\s*>|<!--|<(/?)([a-zA-Z][a-zA-Z0-9]*)\b([^>]*)>',
+        re.DOTALL | re.IGNORECASE,
+    )
+
+    def __init__(self, containers, text_container=None):
+        self.containers = containers
+        self.text_container = text_container
+        self.open = {}     # container -> nesting depth of its tag name
+        self.done = set()
+        self.text_chars = 0
+        self.pos = 0
+
+    @staticmethod
+    def _matches(container, name, attrs):
+        tag, attr, value = container
+        if name != tag: return False
+        match = re.search(rb'\b' + attr.encode() + rb'''\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))''', attrs, re.IGNORECASE)
+        if not match: return False
+        found = next(group for group in match.groups() if group is not None).decode('utf-8', 'replace')
+        return value in found.split() if attr == 'class' else found.strip() == value
+
+    def _tag(self, name, closing, attrs):
+        for container, depth in list(self.open.items()):
+            if container[0] == name:
+                depth += -1 if closing else 1
+                if depth == 0:
+                    del self.open[container]
+                    self.done.add(container)
+                else:
+                    self.open[container] = depth
+        if not closing:
+            for container in self.containers:
+                if container not in self.done and container not in self.open and self._matches(container, name, attrs):
+                    self.open[container] = 1
+
+    def finished(self):
+        pending = [container for container in self.containers if container not in self.done]
+        if not pending: return True
+        return pending == [self.text_container] and self.text_chars >= STREAM_TEXT_TARGET_CHARS
+
+    def feed(self, body):
+        """Scans what was added to body (everything downloaded so far). Returns True once reading can stop."""
+        for match in self._TOKEN.finditer(body, self.pos):
+            if match.group(0) == b'<!--': break  # Comment not complete yet
+            name = match.group(3)
+            if name is not None:
+                name = name.decode('ascii').lower()
+                if name in ('script', 'style') and not match.group(2): break  # Block not complete yet
+            if self.text_container in self.open:
+                self.text_chars += len(body[self.pos:match.start()].strip())
+            if name is not None:  # Comments and whole script/style blocks are skipped
+                self._tag(name, bool(match.group(2)), match.group(4))
+            self.pos = match.end()
+            if self.finished(): return True
+        return False
+
+def read_article_body(chunks, stream_spec=None, cancel=None):
+    """
+    Collects downloaded chunks until the StreamStopper for stream_spec says the page has
+    everything its parser reads, or ARTICLE_MAX_BYTES have been read. Returns the bytes read.
+    Also stops once the threading.Event cancel is set, returning b'' since the page is incomplete.
+    """
+    stopper = StreamStopper(**stream_spec) if stream_spec else None
+    body = bytearray()
+    for chunk in chunks:
+        if cancel is not None and cancel.is_set():
+            return b''
+        body += chunk
+        if len(body) >= ARTICLE_MAX_BYTES:
+            print(f"  Stopped reading after {len(body)} bytes (ARTICLE_MAX_BYTES).")
+            break
+        if stopper and stopper.feed(body):
+            break
+    return bytes(body)
+
+def http_get_article(url, stream_spec=None, cancel=None, **kwargs):
+    """Streams an article page through the shared session, stopping early as read_article_body allows."""
+    with http_get(url, stream=True, **kwargs) as response:
+        response.raise_for_status()
+        return read_article_body(response.iter_content(STREAM_CHUNK_SIZE), stream_spec, cancel)
+
+# --- Crossref client: polite-pool requests, batched prefetch and a per-DOI cache. Shared by both engines. ---
+
+def crossref_request_options():
+    """Headers and query parameters that identify us to Crossref, for its polite pool."""
+    if not CROSSREF_MAILTO: return {'headers': {}, 'params': {}}
+    user_agent = f"{YOUR_APP_NAME} ({YOUR_SITE_URL}; mailto:{CROSSREF_MAILTO})"
+    return {'headers': {'User-Agent': user_agent}, 'params': {'mailto': CROSSREF_MAILTO}}
+
+def crossref_abstract(work):
+    """Returns the plain-text abstract of a Crossref work record, or None."""
+    abstract_html = work.get('abstract')
+    if not abstract_html: return None
+    return BeautifulSoup(abstract_html, 'html.parser').get_text(separator=' ', strip=True)
+
+def remember_crossref_work(doi, work):
+    CROSSREF_CACHE.set(doi, {'found': True, 'abstract': crossref_abstract(work)})
+
+def remember_crossref_not_found(doi):
+    CROSSREF_CACHE.set(doi, {'found': False}, ttl_seconds=CROSSREF_NOT_FOUND_TTL_HOURS * 3600)
+
+def crossref_result(record):
+    """Turns a cached Crossref record into a scrape_result."""
+    if not record['found']: print(f"  DOI not found in Crossref (404)."); return scrape_result("NOT_FOUND_IN_API")
+    if not record['abstract']: print("  Crossref response did not contain an abstract."); return scrape_result()
+    print(f"  Successfully fetched {len(record['abstract'])} characters from Crossref.")
+    return scrape_result(record['abstract'])
+
+def crossref_prefetch_batches(entries, state):
+    """
+    Splits the DOIs of a feed's unposted, uncached entries into batches for
+    crossref_batch_params. DOIs with a comma can't go in a filter and are left to the single lookup.
+    """
+    dois = []
+    for entry in entries:
+        doi = entry_doi(entry)
+        if not doi or ',' in doi or doi in dois or CROSSREF_CACHE.get(doi) is not None: continue
+        if canonical_url(entry.link) in state['posted_links']: continue
+        if any(key in state['global_index'] for key in dedup_keys(entry.link, doi)): continue
+        dois.append(doi)
+    return [dois[i:i + CROSSREF_BATCH_SIZE] for i in range(0, len(dois), CROSSREF_BATCH_SIZE)]
+
+def crossref_batch_params(dois):
+    """Query parameters for one filtered /works request that returns every work in dois."""
+    return {'filter': ','.join(f"doi:{doi}" for doi in dois), 'rows': len(dois), 'select': 'DOI,abstract'}
+
+def store_crossref_batch(data):
+    """
+    Caches the works in a filtered /works response. DOIs missing from it are not cached as
+    not found: the single lookup confirms that with a 404 when the entry is reached.
+    """
+    items = data.get('message', {}).get('items', [])
+    for work in items:
+        doi = normalize_doi(work.get('DOI', ''))
+        if doi: remember_crossref_work(doi, work)
+    return len(items)
+
+def prefetch_crossref(entries, state, scraper):
+    """Looks up the DOIs of every new entry in a feed with a few batched queries, filling CROSSREF_CACHE."""
+    options = crossref_request_options()
+    for dois in crossref_prefetch_batches(entries, state):
+        print(f"  Prefetching {len(dois)} DOIs from Crossref in one query.")
+        try:
+            with HOST_SCHEDULER.slot(CROSSREF_API_URL):
+                response = http_get(CROSSREF_API_URL, params={**options['params'], **crossref_batch_params(dois)},
+                                    headers=options['headers'], timeout=scraper['timeout'])
+            response.raise_for_status()
+            print(f"  Crossref knew {store_crossref_batch(response.json())} of them.")
+        except Exception as e: print(f"  Error prefetching from Crossref, falling back to single lookups: {e}")
+
+# --- Scrapers: get one entry's content as a scrape_result. ---
+
+def extract_rss_content(entry, scraper=None):
+    """Takes the text of an entry's embedded content, for sources that need no download."""
+    text = None
+    if 'content' in entry and entry.content:
+        text = BeautifulSoup(entry.content[0].value, 'html.parser').get_text(separator=' ', strip=True)
+        print(f"  Extracted {len(text)} chars from RSS.")
+    return scrape_result(text)
+
+def fetch_content_via_crossref(entry, scraper):
+    print(f"  Attempting Crossref fetch for: {entry.title}")
+    doi = entry_doi(entry)
+    if not doi: print("  Could not find or extract a DOI for this entry."); return scrape_result()
+    record = CROSSREF_CACHE.get(doi)
+    if record is not None: print(f"  Using cached Crossref record for DOI: {doi}"); return crossref_result(record)
+    print(f"  Querying Crossref with DOI: {doi}")
+    options = crossref_request_options()
+    try:
+        with HOST_SCHEDULER.slot(CROSSREF_API_URL):
+            response = http_get(f"{CROSSREF_API_URL}/{doi}", timeout=scraper['timeout'], **options)
+        if response.status_code == 404: remember_crossref_not_found(doi)
+        else: response.raise_for_status(); remember_crossref_work(doi, response.json().get('message', {}))
+        return crossref_result(CROSSREF_CACHE.get(doi))
+    except Exception as e: print(f"  Error contacting Crossref API: {e}"); return scrape_result()
+
+def scrape_article_page(scraper, url, cancel=None):
+    """
+    Streams the page with the shared session, within its host's HOST_SCHEDULER limits, then parses it
+    with parse_article_page. Once cancel is set, no slot is taken and no request is sent.
+    """
+    if cancel is not None and cancel.is_set(): return scrape_result()
+    print(f"  Scraping {scraper['label']}: {url}")
+    try:
+        with HOST_SCHEDULER.slot(url):
+            if cancel is not None and cancel.is_set(): return scrape_result()
+            html = http_get_article(url, scraper['stream'], cancel, timeout=scraper['timeout'])
+        return parse_article_page(scraper, url, html)
+    except Exception as e:
+        print(f"  Error scraping {scraper['label']}: {e}"); return scrape_result()
+
+# --- Scraper registry: how each source 'type' in sources/*.json gets its content. ---
+# Every scraper has a log label, a timeout in seconds and max_concurrency (how many of its
+# scrapes may run at once across all sources; None for no limit).
+# Page scrapers download entry.link and extract with parse_article_page:
+#   body       selectors for the article body, tried in order
+#   text       selector for the text blocks in the body, kept as paragraphs; None takes all its text
+#   skip       selector for parts of the body left out of the text, such as figure captions and reference lists
+#   image/doi  selectors on the whole page for the lead image and the DOI link; None if the site has none
+#   targets    containers the BeautifulSoup backends build (see parse_html); must hold every selector above
+#   stream     containers a download must reach before it can stop (see StreamStopper)
+# Other scrapers have fetch(entry, scraper) instead, and may have prefetch(entries, state, scraper),
+# which is called once with a feed's ranked entries before they are scraped one by one.
+# Any scraper may list in 'requires' the feed entry fields it cannot work without ('doi', 'content');
+# candidate_score puts entries lacking them last.
+SCRAPERS = {
+    'sciencedaily': {
+        'label': 'ScienceDaily article', 'timeout': HTTP_TIMEOUT, 'max_concurrency': 2,
+        'body': ['div#story_text'], 'text': 'p', 'skip': 'figure',
+        'image': 'figure.mainimg img', 'doi': 'div#journal_references a[href*="dx.doi.org"]',
+        'targets': [{'name': 'div', 'id': 'story_text'}, {'name': 'figure'}, {'name': 'div', 'id': 'journal_references'}],
+        'stream': {
+            'containers': [('figure', 'class', 'mainimg'), ('div', 'id', 'story_text'), ('div', 'id', 'journal_references')],
+            'text_container': ('div', 'id', 'story_text'),
+        },
+    },
+    'phys_org': {
+        'label': 'Phys.org article', 'timeout': HTTP_TIMEOUT, 'max_concurrency': 2,
+        'body': ['div.article-main'], 'text': 'p', 'skip': 'figure, div.article-main__more',
+        'image': 'div.article-main figure.article-img img', 'doi': 'div.article-main__more a[data-doi="1"]',
+        'targets': [{'name': 'div', 'class_': _class_pattern('article-main', 'article-main__more')}],
+        'stream': {
+            'containers': [('div', 'class', 'article-main'), ('div', 'class', 'article-main__more')],
+            'text_container': ('div', 'class', 'article-main'),
+        },
+    },
+    'full_page_scrape': {
+        'label': 'full article page', 'timeout': HTTP_TIMEOUT, 'max_concurrency': 2,
+        'body': ['div.c-article-body', 'div.article__body'], 'text': 'p', 'image': None, 'doi': None,
+        'skip': 'figure, .c-article-section__figure, .c-article-references, .c-article-references__links',
+        'targets': [{'name': 'div', 'class_': _class_pattern('c-article-body', 'article__body')}],
+        'stream': {'containers': [('div', 'class', 'c-article-body')], 'text_container': ('div', 'class', 'c-article-body')},
+    },
+    'pubmed': {
+        'label': 'PubMed abstract', 'timeout': HTTP_TIMEOUT, 'max_concurrency': 2,
+        'body': ['div.abstract-content'], 'text': None, 'image': None, 'doi': None,
+        'targets': [{'name': 'div', 'class_': _class_pattern('abstract-content')}],
+        'stream': {'containers': [('div', 'class', 'abstract-content')]},
+    },
+    'crossref_doi': {
+        'label': 'Crossref abstract', 'timeout': 15, 'max_concurrency': 4,
+        'fetch': fetch_content_via_crossref, 'prefetch': prefetch_crossref, 'requires': ['doi'],
+    },
+    'rss_content_only': {
+        'label': 'RSS content', 'timeout': None, 'max_concurrency': None,
+        'fetch': extract_rss_content, 'requires': ['content'],
+    },
+}
+
+# One slot pool per scraper type, shared by every source and group in the sync engine.
+SCRAPER_SLOTS = {
+    source_type: threading.BoundedSemaphore(scraper['max_concurrency'])
+    for source_type, scraper in SCRAPERS.items() if scraper.get('max_concurrency')
+}
+
+# ==============================================================================
+# --- 3. AI ANALYSIS FUNCTIONS (REFACTORED) ---
+# ==============================================================================
+
+# --- Shared AI client: per-provider rate limits, retries with backoff, and the run's AI time budget. ---
+
+class TokenBucket:
+    """
+    Spaces calls to requests_per_minute on average, letting up to `burst` through back to back.
+    Thread-safe: each caller reserves its slot under the lock and then sleeps until it comes.
+    """
+    def __init__(self, requests_per_minute, burst=1):
+        self.interval = 60.0 / requests_per_minute
+        self.burst = max(1, burst)
+        self._next_free = 0.0  # When the bucket will be empty again if no call reserves a slot
+        self._lock = threading.Lock()
+
+    def acquire(self, max_wait):
+        """Waits for a slot. Returns the seconds waited, or None (without waiting) if that would take over max_wait."""
+        with self._lock:
+            now = time.monotonic()
+            next_free = max(self._next_free, now)
+            wait = max(0.0, next_free - self.interval * (self.burst - 1) - now)
+            if wait > max_wait: return None
+            self._next_free = next_free + self.interval
+        if wait: time.sleep(wait)
+        return wait
+
+    def hold(self, seconds):
+        """Makes every caller wait at least `seconds` from now, e.g. after the provider answered 429."""
+        with self._lock:
+            self._next_free = max(self._next_free, time.monotonic() + seconds + self.interval * (self.burst - 1))
+
+class AITimeBudget:
+    """Seconds of AI calls a run may spend, counting rate-limit waits and backoff, summed over all threads."""
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.used = 0.0
+        self._lock = threading.Lock()
+
+    def remaining(self):
+        with self._lock: return self.seconds - self.used
+
+    def exhausted(self):
+        return self.remaining() <= 0
+
+    def charge(self, seconds):
+        with self._lock: self.used += seconds
+
+AI_TIME_BUDGET = AITimeBudget(AI_TIME_BUDGET_SECONDS)
+
+class CircuitBreaker:
+    """
+    Health of one AI provider. After AI_CIRCUIT_FAILURE_THRESHOLD failed calls in a row the circuit
+    opens and the provider is skipped for AI_CIRCUIT_COOLDOWN_SECONDS. Then a single trial call is
+    let through: success closes the circuit again, failure opens it for another cooldown.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None: return True
+            if time.monotonic() - self.opened_at < AI_CIRCUIT_COOLDOWN_SECONDS: return False
+            # Restart the window, so only this call gets through until it reports back
+            self.opened_at, self.trial_running = time.monotonic(), True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None: print(f"  [{self.name.upper()}] is answering again; circuit closed.")
+            self.failures, self.opened_at, self.trial_running = 0, None, False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_running or (self.opened_at is None and self.failures >= AI_CIRCUIT_FAILURE_THRESHOLD):
+                print(f"  [{self.name.upper()}] failed {self.failures} call(s) in a row; skipping it for {AI_CIRCUIT_COOLDOWN_SECONDS}s.")
+                self.opened_at, self.trial_running = time.monotonic(), False
+
+AI_CIRCUITS = {provider: CircuitBreaker(provider) for provider in ('gemini', 'groq')}
+_AI_RATE_LIMITERS = {}
+_AI_RATE_LIMITERS_LOCK = threading.Lock()
+
+def ai_rate_limiter(provider, model):
+    """The TokenBucket shared by every call to one provider and model."""
+    with _AI_RATE_LIMITERS_LOCK:
+        key = f"{provider}:{model}"
+        if key not in _AI_RATE_LIMITERS:
+            _AI_RATE_LIMITERS[key] = TokenBucket(AI_REQUESTS_PER_MINUTE[provider], AI_RATE_BURST)
+        return _AI_RATE_LIMITERS[key]
+
+def _retry_after_seconds(response):
+    """How long the provider asked us to wait, from Retry-After or (Gemini) the error's retryDelay, or None."""
+    value = response.headers.get('Retry-After')
+    if value:
+        try: return max(0.0, float(value))
+        except ValueError: pass
+        try: return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError): pass
+    try:
+        for detail in response.json().get('error', {}).get('details', []):
+            delay = str(detail.get('retryDelay', ''))
+            if delay.endswith('s'): return float(delay[:-1])
+    except (ValueError, AttributeError): pass
+    return None
+
+def _ai_retry_delay(response, attempt):
+    """Exponential backoff with full jitter, but never shorter than what the provider asked for."""
+    delay = random.uniform(0, min(AI_RETRY_MAX_DELAY, AI_RETRY_BASE_DELAY * 2 ** attempt))
+    retry_after = _retry_after_seconds(response) if response is not None else None
+    if retry_after is not None: delay = max(delay, retry_after + random.uniform(0, 1))
+    return delay
+
+def record_ai_outcome(provider, ok):
+    """Counts a call's outcome in the provider's circuit, if it has one."""
+    if provider not in AI_CIRCUITS: return
+    if ok: AI_CIRCUITS[provider].record_success()
+    else: AI_CIRCUITS[provider].record_failure()
+
+def ai_post(provider, model, url, **kwargs):
+    """
+    POSTs one AI request within the provider's rate limit, retrying 429/5xx answers and connection
+    errors up to AI_MAX_RETRIES times, and records the outcome in the provider's circuit: 2xx is a
+    success, any other answer a failure. A streamed 2xx is left to read_streamed_json and a streamed
+    400 to streaming_refused. Returns the last response (the caller checks its status), or None once the run's AI time
+    budget is used up. A last connection error is re-raised.
+    """
+    limiter = ai_rate_limiter(provider, model)
+    for attempt in range(AI_MAX_RETRIES + 1):
+        waited = limiter.acquire(AI_TIME_BUDGET.remaining()) if AI_TIME_BUDGET.remaining() > 0 else None
+        if waited is None:
+            print(f"  AI time budget of {AI_TIME_BUDGET.seconds}s for this run is used up, skipping the {provider} call.")
+            return None
+        start = time.monotonic()
+        response = error = None
+        try:
+            response = http_post(url, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            error = e
+        AI_TIME_BUDGET.charge(waited + time.monotonic() - start)
+
+        if response is not None and response.status_code not in AI_RETRY_STATUSES:
+            ok = 200 <= response.status_code < 300
+            if not (kwargs.get('stream') and (ok or response.status_code == 400)):
+                record_ai_outcome(provider, ok)
+            return response
+        if attempt == AI_MAX_RETRIES: break
+        delay = _ai_retry_delay(response, attempt)
+        if delay > AI_TIME_BUDGET.remaining(): break
+        reason = f"HTTP {response.status_code}" if response is not None else type(error).__name__
+        print(f"  {provider} call failed ({reason}); retrying in {delay:.1f}s ({attempt + 1}/{AI_MAX_RETRIES}).")
+        limiter.hold(delay)  # Other threads calling the same model back off too
+        if response is not None: response.close()  # Frees the connection of a streamed request
+    record_ai_outcome(provider, False)
+    if error is not None: raise error
+    return response
+
+# --- Streamed answers: SSE chunks assembled and checked as they arrive. ---
+
+class IncrementalJSONChecker:
+    """
+    Checks JSON text as it arrives without parsing it: tracks strings and bracket nesting and raises
+    ValueError at the first character that cannot belong to a JSON object or array.
+    feed() returns True once the top-level value is complete.
+    """
+    _SCALAR_CHARS = frozenset('0123456789+-.eEtrufalsn')
+
+    def __init__(self):
+        self.parts = []
+        self.closers = []  # Closing brackets still expected, innermost last
+        self.in_string = self.escaped = self.done = False
+
+    def feed(self, chunk):
+        for char in chunk:
+            if self.in_string:
+                if self.escaped: self.escaped = False
+                elif char == '\\': self.escaped = True
+                elif char == '"': self.in_string = False
+            elif char.isspace(): continue
+            elif self.done: raise ValueError(f"unexpected {char!r} after the JSON answer")
+            elif not self.closers and char not in '{[': raise ValueError(f"answer does not start with JSON (got {char!r})")
+            elif char in '{[': self.closers.append('}' if char == '{' else ']')
+            elif char in '}]':
+                if self.closers.pop() != char: raise ValueError(f"mismatched {char!r} in the JSON answer")
+                self.done = not self.closers
+            elif char == '"': self.in_string = True
+            elif char not in ',:' and char not in self._SCALAR_CHARS: raise ValueError(f"unexpected {char!r} in the JSON answer")
+        self.parts.append(chunk)
+        return self.done
+
+    @property
+    def text(self): return ''.join(self.parts)
+
+_STREAMING_REFUSED = set()  # Providers that answered a streamed request with 400; they get plain requests
+
+def ai_streaming(provider):
+    return AI_STREAM_RESPONSES and provider not in _STREAMING_REFUSED
+
+def streaming_refused(provider, response):
+    """
+    True, and remembered for the rest of the run, if a streamed request got a 400 that blames streaming.
+    Any other 400 counts as a failed call in the provider's circuit.
+    """
+    if response.status_code != 400: return False
+    if 'stream' not in response.text.lower():
+        record_ai_outcome(provider, False)
+        return False
+    print(f"  [{provider.upper()}] refused a streamed request; using plain requests for it from now on.")
+    _STREAMING_REFUSED.add(provider)
+    return True
+
+def read_streamed_json(response, chunk_text, provider):
+    """
+    Reads a server-sent-events answer, passing each event's text (chunk_text(event)) through an
+    IncrementalJSONChecker. Returns the parsed JSON as soon as the top-level value is complete.
+    Raises ValueError at the first malformed character or if the stream ends early, and
+    TimeoutError after AI_STREAM_MAX_SECONDS. Either outcome is recorded in the provider's circuit.
+    """
+    checker = IncrementalJSONChecker()
+    start = time.monotonic()
+    response.encoding = 'utf-8'  # text/event-stream has no charset, and requests would assume Latin-1
+    try:
+        for line in response.iter_lines(decode_unicode=True):
+            if time.monotonic() - start > AI_STREAM_MAX_SECONDS:
+                raise TimeoutError(f"streamed answer took over {AI_STREAM_MAX_SECONDS}s")
+            if not line or not line.startswith('data:'): continue
+            data = line[len('data:'):].strip()
+            if data == '[DONE]': break
+            event = json.loads(data)
+            if isinstance(event, dict) and event.get('error'):
+                raise ValueError(f"provider error in stream: {event['error']}")
+            if checker.feed(chunk_text(event)):
+                result = json.loads(checker.text)
+                record_ai_outcome(provider, True)
+                return result
+        raise ValueError("stream ended before the JSON answer was complete")
+    except Exception:
+        record_ai_outcome(provider, False)
+        raise
+    finally:
+        response.close()
+        AI_TIME_BUDGET.charge(time.monotonic() - start)
+
+# --- Provider-Specific Implementations ---
+
+def _groq_chunk_text(event):
+    return (event.get('choices') or [{}])[0].get('delta', {}).get('content') or ''
+
+def _get_analysis_from_groq(prompt, model, timeout=45):
+    """Internal function to get a JSON response from the Groq API. When streamed, timeout bounds the wait for each chunk."""
+    stream = ai_streaming('groq')
+    try:
+        response = ai_post(
+            'groq', model, GROQ_API_URL,
+            headers={
+                "Authorization": f"Bearer {GROQ_API_KEY}",
+                "HTTP-Referer": YOUR_SITE_URL,
+                "X-Title": YOUR_APP_NAME,
+            },
+            data=json.dumps({
+                "model": model,
+                "messages": [{"role": "user", "content": prompt}],
+                "response_format": {"type": "json_object"},
+                **({"stream": True} if stream else {}),
+            }),
+            timeout=timeout,
+            stream=stream,
+        )
+        if response is None: return None
+        if stream and streaming_refused('groq', response):
+            return _get_analysis_from_groq(prompt, model, timeout)
+        response.raise_for_status()
+        if stream: return read_streamed_json(response, _groq_chunk_text, 'groq')
+        ai_response_json = response.json()['choices'][0]['message']['content']
+        return json.loads(ai_response_json)
+    except Exception as e:
+        print(f"  Error communicating with Groq or parsing response: {e}")
+        return None
+
+def _gemini_chunk_text(event):
+    candidates = event.get('candidates') or [{}]
+    return ''.join(part.get('text', '') for part in candidates[0].get('content', {}).get('parts', []))
+
+def _get_analysis_from_gemini(prompt, model, timeout=45):
+    """Internal function to get a JSON response from the Gemini API. When streamed, timeout bounds the wait for each chunk."""
+    stream = ai_streaming('gemini')
+    method = "streamGenerateContent?alt=sse&" if stream else "generateContent?"
+    url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:{method}key={GEMINI_API_KEY}"
+    data = {
+        "contents": [{"parts": [{"text": prompt}]}],
+        "generationConfig": {"response_mime_type": "application/json"}
+    }
+    headers = {"Content-Type": "application/json"}
+
+    try:
+        response = ai_post('gemini', model, url, headers=headers, data=json.dumps(data), timeout=timeout, stream=stream)
+        if response is None: return None
+        if stream and streaming_refused('gemini', response):
+            return _get_analysis_from_gemini(prompt, model, timeout)
+        response.raise_for_status()
+        if stream: return read_streamed_json(response, _gemini_chunk_text, 'gemini')
+        ai_response_text = response.json()['candidates'][0]['content']['parts'][0]['text']
+        return json.loads(ai_response_text)
+    except requests.exceptions.RequestException as e:
+        print(f"  Error communicating with Gemini API: {e}")
+        return None
+    except (KeyError, IndexError, json.JSONDecodeError) as e:
+        print(f"  Error parsing Gemini API response: {e}")
+        return None
+    except ValueError as e:
+        print(f"  Dropped malformed Gemini answer: {e}")
+        return None
+    except Exception as e:
+        print(f"  An unexpected error occurred with Gemini: {e}")
+        return None
+
+# --- Unified Dispatcher Functions ---
+
+# provider -> (model, function that sends a prompt and returns the parsed JSON or None)
+AI_PROVIDERS = {
+    'gemini': (GEMINI_MODEL, _get_analysis_from_gemini),
+    'groq': (GROQ_MODEL, _get_analysis_from_groq),
+}
+
+def _ai_api_key(provider):
+    return {'gemini': GEMINI_API_KEY, 'groq': GROQ_API_KEY}.get(provider)
+
+def ai_provider_chain():
+    """AI_PROVIDER followed by AI_FALLBACK_PROVIDERS, keeping only known providers that have an API key."""
+    chain = []
+    for provider in [AI_PROVIDER] + AI_FALLBACK_PROVIDERS:
+        if provider in AI_PROVIDERS and provider not in chain and _ai_api_key(provider): chain.append(provider)
+    return chain
+
+def _analysis_cache_key(provider, prompt_name, prompt_version, text_content):
+    text_hash = hashlib.sha256(text_content.encode('utf-8')).hexdigest()
+    return f"{provider}:{AI_PROVIDERS[provider][0]}:{prompt_name}-v{prompt_version}:{text_hash}"
+
+def _cached_analysis(prompt_name, prepared):
+    """Returns an answer any provider already gave for its prepared text (provider -> text) and this prompt version, or None."""
+    version = AI_ANALYSES[prompt_name]['version']
+    for provider, text in prepared.items():
+        ai_data = LLM_CACHE.get(_analysis_cache_key(provider, prompt_name, version, text))
+        if ai_data is not None: return ai_data
+    return None
+
+def _run_analysis(prompt_name, text_content):
+    """
+    Sends the 'paper' or 'news' prompt to the first healthy provider of ai_provider_chain(),
+    falling over to the next one when a call fails. Each provider gets the text prepared for its
+    token budget. Reuses a cached answer when any provider in the chain, with the same model and
+    prompt version, already analysed the same prepared text.
+    """
+    chain = ai_provider_chain()
+    if not chain:
+        print(f"  ERROR: No usable AI provider configured (AI_PROVIDER={AI_PROVIDER}).")
+        return None
+
+    analysis = AI_ANALYSES[prompt_name]
+    prepared = _prepared_texts(text_content, chain)
+    ai_data = _cached_analysis(prompt_name, prepared)
+    if ai_data is not None:
+        print("  Using cached AI analysis for this text.")
+        return ai_data
+
+    for provider in chain:
+        if not AI_CIRCUITS[provider].allow():
+            print(f"  [{provider.upper()}] circuit is open, skipping it.")
+            continue
+        model, analyse = AI_PROVIDERS[provider]
+        text = prepared[provider]
+        print(f"  Asking [{provider.upper()}] ({model}) with {len(text)} of {len(text_content)} chars (~{estimate_tokens(text)} tokens)...")
+        ai_data = analyse(analysis['prompt'].format(fields=_prompt_fields(analysis['fields']), text=text), model)
+        if ai_data:
+            LLM_CACHE.set(_analysis_cache_key(provider, prompt_name, analysis['version'], text), ai_data)
+            return ai_data
+    return None
+
+# --- Text preparation: what of an article goes into a prompt. ---
+
+def estimate_tokens(text):
+    """
+    Fast estimate of a text's token count without a tokenizer: every punctuation mark is a token
+    and every word one token per 5 characters (started). Close to real tokenizers for English,
+    and on the safe side for long scientific words.
+    """
+    return sum(1 + (len(piece) - 1) // 5 for piece in _TOKEN_PIECE.findall(text))
+
+_TOKEN_PIECE = re.compile(r'\w+|[^\w\s]')
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+def is_boilerplate(paragraph):
+    """
+    True for paragraphs that are page furniture rather than article: source footers, captions, reference entries.
+
+    >>> is_boilerplate('Story Source: Materials provided by MIT.')
+    True
+    >>> is_boilerplate('Fig. 2 | Place cells firing along the track.')
+    True
+    >>> is_boilerplate('Citation analysis of 3,000 papers shows a bias toward positive results.')
+    False
+    >>> is_boilerplate('Figure 2 in the study shows that neurons fire together.')
+    False
+    """
+    if AI_BOILERPLATE_PATTERN.match(paragraph): return True
+    if len(paragraph) <= AI_CAPTION_MAX_CHARS and AI_CAPTION_PATTERN.match(paragraph): return True
+    # A short paragraph with a DOI or a scholar link is a reference entry
+    return len(paragraph) < 400 and bool(AI_REFERENCE_PATTERN.search(paragraph))
+
+def _fit_sentences(paragraph, token_budget):
+    """The leading sentences of paragraph that fit token_budget (hard-cut if not even the first fits)."""
+    kept, used = [], 0
+    for sentence in _SENTENCE_END.split(paragraph):
+        tokens = estimate_tokens(sentence)
+        if used + tokens > token_budget: break
+        kept.append(sentence); used += tokens
+    return ' '.join(kept) if kept else paragraph[:token_budget * 4]
+
+def prepare_ai_text(text_content, token_budget):
+    """
+    Cleans article text for a prompt: drops boilerplate (is_boilerplate) and repeated paragraphs,
+    then keeps whole paragraphs from the top, so the abstract and lead come first, until
+    token_budget (by estimate_tokens) is reached. The paragraph that crosses the budget is cut
+    at a sentence boundary.
+    """
+    paragraphs, seen = [], set()
+    for paragraph in re.split(r'\n\s*\n', text_content[:AI_MAX_INPUT_CHARS]):
+        paragraph = ' '.join(paragraph.split())
+        key = paragraph.lower()
+        if not paragraph or key in seen or is_boilerplate(paragraph): continue
+        seen.add(key)
+        paragraphs.append(paragraph)
+    if not paragraphs:  # Everything looked like boilerplate; better to send it than nothing
+        paragraphs = [' '.join(text_content[:AI_MAX_INPUT_CHARS].split())]
+
+    kept, used = [], 0
+    for paragraph in paragraphs:
+        tokens = estimate_tokens(paragraph)
+        if used + tokens > token_budget:
+            if token_budget - used >= 50 or not kept: kept.append(_fit_sentences(paragraph, token_budget - used))
+            break
+        kept.append(paragraph); used += tokens
+    return '\n\n'.join(kept)
+
+def _prepared_texts(text_content, chain):
+    """The prepared text for each provider in the chain, as each has its own token budget."""
+    return {provider: prepare_ai_text(text_content, AI_INPUT_TOKEN_BUDGET[provider]) for provider in chain}
+
+# --- Prompts. Changing a template or its fields needs a bump of its *_PROMPT_VERSION. ---
+
+# The keys each analysis returns: key -> (type, what the prompt asks for). Batched answers are checked against these.
+PAPER_ANALYSIS_FIELDS = {
+    'summary': (str, "A 3-4 sentence summary."),
+    'highlights': (list, "A list of 3 key finding strings."),
+    'keywords': (list, "A list of 4-5 keyword strings."),
+    'eli5': (str, "A single sentence explanation."),
+    'big_so_what': (str, "A 1-2 sentence explanation of why this matters."),
+    'analogy': (str, "A single sentence analogy."),
+    'next_steps': (list, "A list of 2-3 short strings about future research."),
+}
+NEWS_ANALYSIS_FIELDS = {
+    'catchy_title': (str, "An engaging, human-like title for the news piece."),
+    'summary': (str, "A simple paragraph, clear summary of the main points."),
+    'keywords': (list, "A list of 3-4 relevant keyword strings."),
+    'eli5': (str, "A single paragraph, ultra-simple explaining the core idea as if to a 5-year-old."),
+}
+
+PAPER_PROMPT = """You are an expert science communicator. Analyze the following scientific text and provide a response ONLY in a valid JSON object format in modern Persian (Farsi). The JSON object must have these exact keys:
+{fields}
+
+Scientific Text to Analyze:
+---
+{text}
+---"""
+NEWS_PROMPT = """You are a science news editor. Summarize the following article for a general Persian-speaking audience. Provide a response ONLY in a valid JSON object format in modern Persian (Farsi).
+The JSON object must have these exact keys:
+{fields}
+
+Article Text to Analyze:
+---
+{text}
+---"""
+PAPER_BATCH_PROMPT = """You are an expert science communicator. Analyze each of the following {count} scientific texts separately, in modern Persian (Farsi). Respond ONLY with a valid JSON object of the form {{"results": [...]}}, where "results" is an array with exactly one object per text, in the same order. Each object must have an "id" key with the text's number and these exact keys:
+{fields}
+
+{texts}"""
+NEWS_BATCH_PROMPT = """You are a science news editor. Summarize each of the following {count} articles separately for a general Persian-speaking audience, in modern Persian (Farsi). Respond ONLY with a valid JSON object of the form {{"results": [...]}}, where "results" is an array with exactly one object per article, in the same order. Each object must have an "id" key with the article's number and these exact keys:
+{fields}
+
+{texts}"""
+
+# prompt name -> what a single or batched analysis of that kind needs
+AI_ANALYSES = {
+    'paper': {
+        'version': PAPER_PROMPT_VERSION, 'min_chars': 100, 'fields': PAPER_ANALYSIS_FIELDS,
+        'prompt': PAPER_PROMPT, 'batch_prompt': PAPER_BATCH_PROMPT, 'text_label': "Scientific Text",
+    },
+    'news': {
+        'version': NEWS_PROMPT_VERSION, 'min_chars': 50, 'fields': NEWS_ANALYSIS_FIELDS,
+        'prompt': NEWS_PROMPT, 'batch_prompt': NEWS_BATCH_PROMPT, 'text_label': "Article",
+    },
+}
+# post_format in sources/*.json -> prompt name
+POST_FORMAT_ANALYSES = {'scientific_paper': 'paper', 'scientific_news': 'news'}
+
+def _prompt_fields(fields):
+    return '\n'.join(f'- "{key}": {description}' for key, (_, description) in fields.items())
+
+def get_ai_paper_analysis(text_content):
+    """
+    Analyzes scientific text for a paper summary.
+    This function dispatches the request along ai_provider_chain().
+    """
+    if not text_content or len(text_content) < AI_ANALYSES['paper']['min_chars']:
+        print("  Text too short, skipping AI paper analysis.")
+        return None
+        
+    print("  Sending for DETAILED PAPER analysis...")
+    return _run_analysis('paper', text_content)
+
+def get_ai_news_analysis(text_content):
+    """
+    Analyzes article text for a news summary.
+    This function dispatches the request along ai_provider_chain().
+    """
+    if not text_content or len(text_content) < AI_ANALYSES['news']['min_chars']:
+        print("  Text too short, skipping AI news analysis.")
+        return None
+
+    print("  Sending for GENERAL NEWS analysis...")
+    return _run_analysis('news', text_content)
+
+# --- Batched analysis: several articles in one request. ---
+
+def valid_analysis(ai_data, fields):
+    """True if ai_data has every key in fields, each a non-empty value of the expected type."""
+    if not isinstance(ai_data, dict): return False
+    for key, (kind, _) in fields.items():
+        value = ai_data.get(key)
+        if not isinstance(value, kind) or not value: return False
+        if kind is list and not all(isinstance(part, str) for part in value): return False
+    return True
+
+def _batch_results(ai_data, count):
+    """Orders the objects of a batched answer by their "id" (1..count), or by position without ids."""
+    results = ai_data.get('results') if isinstance(ai_data, dict) else ai_data
+    if not isinstance(results, list): return [None] * count
+    by_id = {}
+    for result in results:
+        if isinstance(result, dict) and str(result.get('id', '')).strip().isdigit():
+            by_id.setdefault(int(str(result['id']).strip()), result)
+    if by_id: return [by_id.get(number) for number in range(1, count + 1)]
+    return (results + [None] * count)[:count]
+
+def _pack_batches(texts, max_tokens):
+    """Splits texts into runs of at most AI_BATCH_SIZE whose combined estimate_tokens stays within max_tokens."""
+    batches, batch, size = [], [], 0
+    for index, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if batch and (len(batch) >= AI_BATCH_SIZE or size + tokens > max_tokens):
+            batches.append(batch); batch, size = [], 0
+        batch.append(index); size += tokens
+    if batch: batches.append(batch)
+    return batches
+
+def _run_batch(prompt_name, texts, provider):
+    """One batched request to provider. Returns a validated answer or None for each text."""
+    analysis = AI_ANALYSES[prompt_name]
+    model, analyse = AI_PROVIDERS[provider]
+    label = analysis['text_label']
+    prompt = analysis['batch_prompt'].format(
+        count=len(texts), fields=_prompt_fields(analysis['fields']),
+        texts='\n\n'.join(f"{label} {number}:\n---\n{text}\n---" for number, text in enumerate(texts, 1)),
+    )
+    print(f"  Asking [{provider.upper()}] ({model}) to analyse {len(texts)} {prompt_name} texts in one request...")
+    answers = []
+    for text, answer in zip(texts, _batch_results(analyse(prompt, model, timeout=AI_BATCH_TIMEOUT), len(texts))):
+        if valid_analysis(answer, analysis['fields']):
+            answer = {key: answer[key] for key in analysis['fields']}  # Drops the "id"
+            LLM_CACHE.set(_analysis_cache_key(provider, prompt_name, analysis['version'], text), answer)
+        else:
+            answer = None
+        answers.append(answer)
+    return answers
+
+def get_ai_batch_analysis(prompt_name, texts):
+    """
+    Analyzes several texts with the 'paper' or 'news' prompt in as few requests as the first
+    healthy provider's AI_BATCH_MAX_INPUT_TOKENS allows. Returns an answer or None for each text;
+    texts whose answer is missing or fails valid_analysis are left for a single request.
+    """
+    chain = ai_provider_chain()
+    prepared = [_prepared_texts(text, chain) for text in texts]
+    answers = [_cached_analysis(prompt_name, texts_by_provider) for texts_by_provider in prepared]
+    pending = [index for index, answer in enumerate(answers) if answer is None]
+    provider = next((provider for provider in chain if AI_CIRCUITS[provider].allow()), None)
+    if len(pending) < 2 or provider is None: return answers
+
+    pending_texts = [prepared[index][provider] for index in pending]
+    for batch in _pack_batches(pending_texts, AI_BATCH_MAX_INPUT_TOKENS.get(provider, 0)):
+        indexes = [pending[position] for position in batch]
+        if len(indexes) < 2: continue
+        for index, answer in zip(indexes, _run_batch(prompt_name, [prepared[index][provider] for index in indexes], provider)):
+            answers[index] = answer
+    missing = sum(answer is None for answer in answers)
+    if missing: print(f"  {missing} of {len(texts)} {prompt_name} texts got no valid batched answer; they go one by one.")
+    return answers
+
+# ==============================================================================
+# --- 4. TELEGRAM & FORMATTING FUNCTIONS ---
+# ==============================================================================
+def format_paper_telegram_message(original_title, source_name, source_info, ai_data, link):
+    header = "🔬 <b>تحلیل مقاله علمی</b> 🔬\n\n"
+    title_section = f"<b>{original_title}</b>\n\n"
+    summary_section = f"📝 <b>خلاصه خودمونی</b>\n{ai_data.get('summary', '')}\n\n"
+    highlights = ai_data.get('highlights', [])
+    highlights_section = "✨ <b>نکات کلیدی</b>\n" + "\n".join([f"▪️ {item}" for item in highlights]) + "\n\n" if highlights else ""
+    eli5_section = f"🧒 <b>به زبان ساده (ELI5)</b>\n{ai_data.get('eli5', '')}\n\n"
+    big_so_what_section = f"🌍 <b>چرا این مهمه؟</b>\n{ai_data.get('big_so_what', '')}\n\n" if ai_data.get('big_so_what') else ""
+    analogy_section = f"💡 <b>مثال برای درک بهتر</b>\n{ai_data.get('analogy', '')}\n\n" if ai_data.get('analogy') else ""
+    next_steps = ai_data.get('next_steps', [])
+    next_steps_section = "🚀 <b>قدم بعدی چیه؟</b>\n" + "\n".join([f"▪️ {item}" for item in next_steps]) + "\n\n" if next_steps else ""
+    keywords = ai_data.get('keywords', [])
+    keyword_tags = " ".join([f"#{kw.replace(' ', '_').replace('-', '_')}" for kw in keywords])
+    tags_section = f"{source_info['hashtag_en']} #{source_info['category_fa'].replace(' ', '_')}\n{keyword_tags}"
+    link_section = f"🔗 <a href='{link}'>مطالعه مقاله کامل در {source_name}</a>"
+    return f"{header}{title_section}{summary_section}{highlights_section}{eli5_section}{big_so_what_section}{analogy_section}{next_steps_section}{link_section}\n\n{tags_section}"
+
+# --- MODIFIED: Added doi_link parameter and section ---
+def format_news_telegram_message(original_title, source_name, source_info, ai_data, link, doi_link=None):
+    header = "📰 <b>خبر علمی</b> 📰\n\n"
+    catchy_title = ai_data.get('catchy_title', original_title)
+    summary = ai_data.get('summary', '')
+    eli5 = ai_data.get('eli5', '')
+    keywords = ai_data.get('keywords', [])
+
+    title_section = f"<b>{catchy_title}</b>\n\n"
+    summary_section = f"{summary}\n\n"
+    eli5_section = f"🧒 <b>به زبان ساده (ELI5)</b>\n{eli5}\n\n" if eli5 else ""
+    
+    # --- NEW: Section for the DOI link ---
+    doi_section = ""
+    if doi_link:
+        doi_section = f"📖 <b>منبع اصلی (DOI):</b>\n<a href='{doi_link}'>مشاهده مقاله پژوهشی</a>\n\n"
+
+    keyword_tags = " ".join([f"#{kw.replace(' ', '_').replace('-', '_')}" for kw in keywords])
+    tags_section = f"{source_info['hashtag_en']} #{source_info['category_fa'].replace(' ', '_')}\n{keyword_tags}"
+    link_section = f"🔗 <a href='{link}'>مطالعه مطلب کامل در {source_name}</a>"
+    
+    return f"{header}{title_section}{summary_section}{eli5_section}{doi_section}{link_section}\n\n{tags_section}"
+    
+_TELEGRAM_RATE_LIMITERS = {}
+_TELEGRAM_RATE_LIMITERS_LOCK = threading.Lock()
+
+def telegram_rate_limiter(chat_id):
+    """The TokenBucket shared by every call that posts to one chat."""
+    with _TELEGRAM_RATE_LIMITERS_LOCK:
+        if chat_id not in _TELEGRAM_RATE_LIMITERS:
+            _TELEGRAM_RATE_LIMITERS[chat_id] = TokenBucket(TELEGRAM_MESSAGES_PER_MINUTE, TELEGRAM_RATE_BURST)
+        return _TELEGRAM_RATE_LIMITERS[chat_id]
+
+def _telegram_retry_after(response):
+    """Seconds Telegram asked us to wait (parameters.retry_after of a 429 answer), or None."""
+    try: return float(response.json()['parameters']['retry_after'])
+    except (ValueError, KeyError, TypeError): return None
+
+def telegram_call(method, payload, files=None):
+    """
+    Calls a Bot API method within the rate limit of payload's chat. A 429 is retried after its
+    retry_after, a 5xx answer or failed connection after a backoff, up to TELEGRAM_MAX_RETRIES times.
+    Read timeouts are not retried, since the message may have gone out. Returns the response;
+    raises requests.exceptions.RequestException if the call did not succeed.
+    """
+    limiter = telegram_rate_limiter(payload['chat_id'])
+    url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/{method}"
+    for attempt in range(TELEGRAM_MAX_RETRIES + 1):
+        if limiter.acquire(TELEGRAM_MAX_WAIT) is None:
+            raise requests.exceptions.RequestException(f"Telegram rate limit would hold {method} over {TELEGRAM_MAX_WAIT}s")
+        response = error = None
+        try:
+            response = http_post(url, data=payload, files=files, timeout=30)
+        except requests.exceptions.ConnectionError as e:
+            error = e
+        if response is not None and response.status_code != 429 and response.status_code < 500:
+            response.raise_for_status()
+            return response
+        if attempt == TELEGRAM_MAX_RETRIES: break
+        retry_after = _telegram_retry_after(response) if response is not None else None
+        delay = retry_after + 1 if retry_after is not None else min(TELEGRAM_MAX_WAIT, 2.0 * 2 ** attempt)
+        if delay > TELEGRAM_MAX_WAIT: break
+        reason = f"HTTP {response.status_code}" if response is not None else type(error).__name__
+        print(f"  Telegram {method} failed ({reason}); retrying in {delay:.0f}s ({attempt + 1}/{TELEGRAM_MAX_RETRIES}).")
+        limiter.hold(delay)  # Every post to this chat waits it out, not just this one
+    if error is not None: raise error
+    response.raise_for_status()
+
+# --- Posting plan: the fewest calls that deliver a post, with its HTML split where Telegram allows. ---
+
+_TELEGRAM_TOKEN = re.compile(r'<[^>]*>|&#?\w+;|[^<&]+|[<&]')
+_TELEGRAM_BREAKS = ('\n\n', '\n', ' ')  # Preferred places to split a post, best first
+
+def telegram_length(text):
+    """
+    Length of Telegram HTML as Telegram limits it: visible characters, in UTF-16 code units.
+
+    >>> telegram_length('<b>R&amp;D</b> 🧬')  # Tags are free, an entity is one character, an astral emoji two
+    6
+    """
+    return len(unescape(re.sub(r'<[^>]*>', '', text)).encode('utf-16-le')) // 2
+
+def _telegram_cut(text, limit):
+    """
+    Where to end the first part of text so its visible length stays within limit: at the best break
+    (paragraph, then line, then word) in the second half of the room, else as late as fits. Never inside a tag or entity.
+    """
+    length, end, breaks = 0, len(text), []
+    for token in _TELEGRAM_TOKEN.finditer(text):
+        value = token.group()
+        if value.startswith('<') and len(value) > 1: continue
+        if value.startswith('&') and len(value) > 1:
+            if length + 1 > limit: end = token.start(); break
+            length += 1
+            continue
+        for offset, char in enumerate(value):
+            size = 2 if ord(char) > 0xFFFF else 1
+            if length + size > limit: end = token.start() + offset; break
+            length += size
+            position = token.start() + offset + 1
+            if char == '\n' and text[position - 2:position] == '\n\n': breaks.append((0, position))
+            elif char in '\n ': breaks.append((_TELEGRAM_BREAKS.index(char), position))
+        else:
+            continue
+        break
+    if text.startswith('\n\n', end): breaks.append((0, end))
+    elif text[end:end + 1] in ('\n', ' '): breaks.append((_TELEGRAM_BREAKS.index(text[end]), end))
+    usable = [(level, -position) for level, position in breaks if position <= end and position * 2 >= end]
+    return -min(usable)[1] if usable else end
+
+def _tag_name(tag):
+    return re.match(r'</?\s*(\w+)', tag).group(1)
+
+def split_telegram_html(text, first_limit, limit=TELEGRAM_MESSAGE_LIMIT):
+    """
+    Splits Telegram HTML into parts of at most first_limit visible characters for the first part and
+    limit for the rest. Tags left open at a cut are closed at the end of one part and reopened in the next.
+
+    >>> split_telegram_html('<b>bold words here</b> tail', 10)
+    ['<b>bold words</b>', '<b>here</b> tail']
+    >>> split_telegram_html("<a href='https://x.org/a b'>see the paper</a>", 8)
+    ["<a href='https://x.org/a b'>see the</a>", "<a href='https://x.org/a b'>paper</a>"]
+    >>> split_telegram_html('a&amp;b&lt;c', 3)  # Never inside an entity
+    ['a&amp;b', '&lt;c']
+    >>> split_telegram_html('🧬🧬🧬', 4)  # Never between the two halves of an emoji
+    ['🧬🧬', '🧬']
+    >>> split_telegram_html('one two three four five six', 8, 12)  # A caption-sized first part, then larger ones
+    ['one two', 'three four', 'five six']
+    >>> split_telegram_html('one two\\n\\nthree four five', 12, 20)  # A paragraph break beats a fuller part
+    ['one two', 'three four five']
+    """
+    raw_parts = []
+    while text.strip():
+        part_limit = limit if raw_parts else first_limit
+        cut = _telegram_cut(text, part_limit) if telegram_length(text) > part_limit else len(text)
+        raw_parts.append(text[:cut].strip())
+        text = text[cut:]
+    parts, open_tags = [], []
+    for raw in raw_parts:
+        prefix = ''.join(open_tags)
+        for tag in re.findall(r'<[^>]*>', raw):
+            if tag.startswith('</'):
+                if open_tags: open_tags.pop()
+            elif not tag.endswith('/>'):
+                open_tags.append(tag)
+        parts.append(prefix + raw + ''.join(f"</{_tag_name(tag)}>" for tag in reversed(open_tags)))
+    return parts
+
+def plan_telegram_post(message_text, image_url=None):
+    """
+    Picks the fewest Bot API calls that deliver message_text, and the image if there is one: a single
+    photo when the whole text fits its caption, otherwise the photo captioned with the text's first part
+    and the rest as messages. Returns a list of (method, payload) steps, without chat_id.
+
+    >>> [method for method, _ in plan_telegram_post('word ' * 200, 'https://example.org/a.jpg')]
+    ['sendPhoto']
+    >>> [method for method, _ in plan_telegram_post('word ' * 300, 'https://example.org/a.jpg')]
+    ['sendPhoto', 'sendMessage']
+    >>> [method for method, _ in plan_telegram_post('word ' * 300)]  # 1499 characters fit one message
+    ['sendMessage']
+    """
+    if image_url:
+        caption, *rest = split_telegram_html(message_text, TELEGRAM_CAPTION_LIMIT)
+        steps = [('sendPhoto', {'caption': caption, 'parse_mode': 'HTML'})]
+    else:
+        rest, steps = split_telegram_html(message_text, TELEGRAM_MESSAGE_LIMIT), []
+    steps += [('sendMessage', {'text': part, 'parse_mode': 'HTML', 'disable_web_page_preview': True}) for part in rest]
+    return steps
+
+def send_telegram_photo(payload, image_url):
+    """
+    Sends a sendPhoto step for image_url: by its cached file_id, else by URL, else by uploading the image
+    after downloading it ourselves. Caches the file_id Telegram returns. Returns False if Telegram refused
+    every form of the image; other errors are raised.
+    """
+    payload = {'chat_id': TELEGRAM_CHANNEL_ID, **payload}
+    file_id = TELEGRAM_FILE_IDS.get(image_url)
+    for form in (['file_id'] if file_id else []) + ['url', 'upload']:
+        try:
+            if form == 'upload':
+                try:
+                    image = http_get(image_url)
+                    image.raise_for_status()
+                except requests.exceptions.RequestException as e:
+                    print(f"  Could not download the image to upload it: {e}"); return False
+                response = telegram_call('sendPhoto', payload, files={'photo': ('image', image.content)})
+            else:
+                response = telegram_call('sendPhoto', {**payload, 'photo': file_id if form == 'file_id' else image_url})
+        except requests.exceptions.HTTPError as e:
+            if e.response is None or e.response.status_code != 400: raise
+            print(f"  Telegram refused the image by {form}: {e.response.text}")
+            if form == 'file_id': TELEGRAM_FILE_IDS.delete(image_url)
+            continue
+        TELEGRAM_FILE_IDS.set(image_url, response.json()['result']['photo'][-1]['file_id'])
+        return True
+    return False
+
+def _send_telegram_steps(steps):
+    """
+    Sends (method, payload) steps in order. Returns the steps not sent when a call fails, with the error.
+    A call that timed out waiting for its answer may have gone out, so it counts as sent.
+    """
+    steps = list(steps)
+    while steps:
+        method, payload = steps[0]
+        try:
+            telegram_call(method, {'chat_id': TELEGRAM_CHANNEL_ID, **payload})
+        except requests.exceptions.ReadTimeout:
+            print(f"  Telegram {method} timed out; taking it as sent rather than risk posting it twice.")
+        except requests.exceptions.RequestException as e:
+            return steps, e
+        steps.pop(0)
+    return [], None
+
+def _telegram_retryable(e):
+    """True if a failed Telegram call may succeed later: a 429, a 5xx answer or no answer at all."""
+    return e.response is None or e.response.status_code == 429 or e.response.status_code >= 500
+
+def _print_telegram_error(e):
+    print(f"  ❌ Error sending post to Telegram: {e}")
+    if e.response is not None and e.response.text:
+        print(f"  -> Telegram response: {e.response.text}")
+
+def send_to_telegram(message_text, image_url=None):
+    """
+    Sends a post to Telegram in the calls plan_telegram_post picks. If Telegram will not take the
+    image, the text goes out on its own. Returns True once the post is in the channel, so the caller
+    records it then. If it went out only in part, the calls left are kept in TELEGRAM_PENDING for
+    send_pending_telegram_steps rather than sending the whole post again, unless Telegram refused
+    them for good (a 4xx other than 429), in which case they are dropped. A call that timed out
+    waiting for its answer is taken as sent.
+    """
+    if not TELEGRAM_TOKEN or not TELEGRAM_CHANNEL_ID:
+        print("ERROR: TELEGRAM_TOKEN and TELEGRAM_CHANNEL_ID must be set.")
+        return False
+
+    send_pending_telegram_steps()  # An earlier post's continuation goes out before the next post
+    steps = plan_telegram_post(message_text, image_url)
+    print(f"  Sending post to Telegram in {len(steps)} call(s){' with photo' if image_url else ''}...")
+    delivered = False
+    if image_url:
+        try:
+            delivered = send_telegram_photo(steps[0][1], image_url)
+        except requests.exceptions.ReadTimeout:
+            print("  Telegram sendPhoto timed out; taking it as sent rather than risk posting it twice.")
+            delivered = True
+        except requests.exceptions.RequestException as e:
+            _print_telegram_error(e); return False
+        if delivered:
+            steps = steps[1:]
+        else:
+            print("  Posting the text without the image.")
+            steps = plan_telegram_post(message_text)
+
+    remaining, error = _send_telegram_steps(steps)
+    if error is None:
+        print("  ✅ Successfully sent post to Telegram.")
+        return True
+    _print_telegram_error(error)
+    if not delivered and len(remaining) == len(steps):
+        return False
+    if not _telegram_retryable(error):
+        print(f"  Post went out in part; dropping its {len(remaining)} remaining call(s), which Telegram refused.")
+        return True
+    print(f"  Post went out in part; its {len(remaining)} remaining call(s) go out before the next post.")
+    TELEGRAM_PENDING.set(hashlib.sha256(message_text.encode('utf-8')).hexdigest(), remaining)
+    return True
+
+def send_pending_telegram_steps():
+    """
+    Sends what is left of posts that went out only in part on an earlier run, oldest first. A leftover
+    Telegram refuses for good is dropped; one that failed otherwise holds back the rest until next time.
+    """
+    if not TELEGRAM_TOKEN or not TELEGRAM_CHANNEL_ID: return
+    for key in TELEGRAM_PENDING.keys():
+        steps = TELEGRAM_PENDING.get(key)
+        print(f"Completing a post that went out in part ({len(steps)} call(s) left)...")
+        remaining, error = _send_telegram_steps(steps)
+        if error is not None:
+            _print_telegram_error(error)
+            if not _telegram_retryable(error):
+                print(f"  Dropping the {len(remaining)} call(s) left of this post, which Telegram refused.")
+                TELEGRAM_PENDING.delete(key)
+                continue
+            if len(remaining) < len(steps): TELEGRAM_PENDING.set(key, remaining)
+            return  # Keep the channel in order: later leftovers wait for this one
+        TELEGRAM_PENDING.delete(key)
+
+# ==============================================================================
+# --- 5. MAIN EXECUTION LOGIC (MODIFIED) ---
+# ==============================================================================
+def list_source_groups():
+    """Returns the names of all groups defined in SOURCES_DIR, in sorted order."""
+    return sorted(os.path.splitext(name)[0] for name in os.listdir(SOURCES_DIR) if name.endswith('.json'))
+
+def load_source_group(group_name):
+    """
+    Loads sources/<group_name>.json.
+    Returns a dict with 'name', 'sources', 'posted_links_file' and 'feed_cache_file',
+    the two file paths resolved against BASE_DIR.
+    """
+    with open(os.path.join(SOURCES_DIR, f"{group_name}.json"), 'r', encoding='utf-8') as f:
+        group = json.load(f)
+    group['name'] = group_name
+    group['posted_links_file'] = os.path.join(BASE_DIR, group['posted_links_file'])
+    group['feed_cache_file'] = os.path.join(BASE_DIR, group['feed_cache_file'])
+    return group
+
+def scrape_entry(entry, source_info, cancel=None):
+    """
+    Runs the SCRAPERS entry for the source's type. Returns a scrape_result, or None for an unknown type.
+    Once the threading.Event cancel is set, a page download stops and the result is incomplete.
+    """
+    source_type = source_info.get('type')
+    scraper = SCRAPERS.get(source_type)
+    if scraper is None:
+        print(f"  No scraper registered for source type '{source_type}'.")
+        return None
+    with SCRAPER_SLOTS.get(source_type) or contextlib.nullcontext():
+        if cancel is not None and cancel.is_set(): return scrape_result()
+        if 'fetch' in scraper: return scraper['fetch'](entry, scraper)
+        return scrape_article_page(scraper, entry.link, cancel)
+
+def claim_keys(state, keys):
+    """Reserves an article's dedup keys for one source. Returns False if it is posted or already claimed."""
+    with state['lock']:
+        if any(key in state['global_index'] or key in state['claimed'] for key in keys):
+            return False
+        state['claimed'].update(keys)
+        return True
+
+def release_keys(state, keys):
+    with state['lock']:
+        state['claimed'].difference_update(keys)
+
+# --- Candidate scoring: try the entries most likely to give a usable article first. ---
+
+def min_text_chars(source_info):
+    """Shortest text the AI stage accepts for this source's post format."""
+    prompt_name = POST_FORMAT_ANALYSES.get(source_info.get('post_format'))
+    return AI_ANALYSES[prompt_name]['min_chars'] if prompt_name else 1
+
+def _entry_text_length(value):
+    return len(re.sub(r'<[^>]+>', ' ', value or '').strip())
+
+def _host_history_key(source_name, link):
+    return f"host:{source_name}|{urlparse(link).netloc}"
+
+def candidate_score(entry, source_name, source_info):
+    """
+    Estimates how likely an entry is to give a usable article, from fields already in the feed entry
+    (content, summary length, DOI, age) and SCRAPE_HISTORY. Higher is better; below 0 it is expected to fail.
+    """
+    scraper = SCRAPERS.get(source_info.get('type'), {})
+    content_chars = _entry_text_length(entry.content[0].value) if entry.get('content') else 0
+    summary_chars = _entry_text_length(entry.get('summary'))
+    doi = entry_doi(entry)
+    has = {'doi': bool(doi), 'content': content_chars >= min_text_chars(source_info)}
+
+    score = 0.0
+    if not all(has.get(field, True) for field in scraper.get('requires', [])): score -= 4
+    if SCRAPE_HISTORY.get(f"link:{canonical_url(entry.link)}"): score -= 4
+    score += min(content_chars, 2000) / 2000 + min(summary_chars, 1000) / 1000
+    if doi: score += 0.5
+    published = entry.get('published_parsed') or entry.get('updated_parsed')
+    if published:
+        age_hours = max(0.0, (time.time() - datetime(*published[:6], tzinfo=timezone.utc).timestamp()) / 3600)
+        score += 1 / (1 + age_hours / 24)
+    counts = SCRAPE_HISTORY.get(_host_history_key(source_name, entry.link))
+    if counts: score -= 2 * counts['failures'] / (counts['tries'] + 2)
+    return score
+
+def record_scrape(source_name, source_info, entry, link_to_check, content_data):
+    """Adds the outcome of a fresh scrape to SCRAPE_HISTORY, which candidate_score reads on later runs."""
+    text = content_data.get('text') if content_data else None
+    failed = not text or len(text) < min_text_chars(source_info)
+    host_key = _host_history_key(source_name, entry.link)
+    counts = SCRAPE_HISTORY.get(host_key) or {'tries': 0, 'failures': 0}
+    if counts['tries'] >= 50:  # Halve old counts so the rate follows recent behaviour
+        counts = {'tries': counts['tries'] / 2, 'failures': counts['failures'] / 2}
+    SCRAPE_HISTORY.set(host_key, {'tries': counts['tries'] + 1, 'failures': counts['failures'] + failed})
+    if failed:
+        SCRAPE_HISTORY.set(f"link:{link_to_check}", True, ttl_seconds=SCRAPE_FAILED_LINK_TTL_HOURS * 3600)
+
+def candidate_entries(source_name, source_info, feed, state):
+    """Returns the entries to try from a fetched feed, best first, or None if the source is skipped this run."""
+    if isinstance(feed, Exception):
+        raise feed
+    if feed.get('status') == 304:
+        print(f"  [{source_name}] Feed not modified since last run (304). Skipping.")
+        return None
+    if not feed.entries:
+        print(f"  [{source_name}] Feed is empty. Skipping.")
+        remember_feed_validators(state['feed_cache'], source_info['url'], feed)
+        return None
+
+    scores = {
+        id(entry): candidate_score(entry, source_name, source_info) + random.uniform(0, CANDIDATE_SCORE_JITTER)
+        for entry in feed.entries[:CANDIDATE_POOL_SIZE]
+    }
+    potential_entries = sorted(feed.entries[:CANDIDATE_POOL_SIZE], key=lambda entry: scores[id(entry)], reverse=True)
+    unlikely = sum(score < 0 for score in scores.values())
+    if unlikely: print(f"  [{source_name}] {unlikely} of {len(scores)} entries are expected to fail and will be tried last.")
+    return potential_entries
+
+def unposted_keys(entry, state):
+    """Returns (link_to_check, entry_keys) for an entry no group has posted yet, otherwise None."""
+    link_to_check = canonical_url(entry.link)
+    if link_to_check in state['posted_links']:
+        return None
+    entry_keys = dedup_keys(entry.link, entry_doi(entry))
+    if any(key in state['global_index'] for key in entry_keys):
+        print(f"  Already posted by another group, skipping: {entry.title}")
+        return None
+    return link_to_check, entry_keys
+
+def cached_content(link_to_check):
+    content_data = CONTENT_CACHE.get(link_to_check)
+    if content_data:
+        print(f"  Using cached content ({len(content_data['text'])} chars), skipping scrape.")
+    return content_data
+
+def store_content(link_to_check, content_data):
+    if content_data and content_data.get('text') and content_data['text'] != "NOT_FOUND_IN_API":
+        CONTENT_CACHE.set(link_to_check, content_data)
+
+def ready_item(source_name, source_info, entry, link_to_check, entry_keys, content_data, state):
+    """
+    Runs the checks between scraping and AI analysis. Returns the work item for the AI stage,
+    with the scraped DOI's keys claimed next to entry_keys (claimed by take_candidates), or None
+    if the entry should be skipped.
+    """
+    full_text = content_data.get('text') if content_data else None
+    # The scraped DOI may point at a paper another group has already posted.
+    doi_keys = dedup_keys(entry.link, content_data.get('doi_link'))[1:] if content_data else []
+    doi_keys = [key for key in doi_keys if key not in entry_keys]
+    if any(key in state['global_index'] for key in doi_keys):
+        print(f"  DOI already posted by another group, skipping: {entry.title}")
+        return None
+    if not full_text:
+        print(f"  No content extracted for '{entry.title}'.")
+        return None
+    if len(full_text) < min_text_chars(source_info):
+        print(f"  Content too short to analyse ({len(full_text)} chars) for '{entry.title}'.")
+        return None
+    if not claim_keys(state, doi_keys):
+        print(f"  Already being processed for another source, skipping: {entry.title}")
+        return None
+    return {
+        'source_name': source_name, 'source_info': source_info, 'entry': entry,
+        'content_data': content_data, 'link_to_check': link_to_check,
+        'dedup_keys': entry_keys + doi_keys,
+    }
+
+def speculative_width(source_info):
+    """How many of a source's entries are scraped at once (SPECULATIVE_SCRAPES, within the scraper's own limit)."""
+    limit = SCRAPERS.get(source_info.get('type'), {}).get('max_concurrency')
+    return max(1, min(SPECULATIVE_SCRAPES, limit or SPECULATIVE_SCRAPES))
+
+def take_candidates(source_name, pending, state, count):
+    """
+    Pops up to count unposted entries off the front of pending, as (entry, link_to_check, entry_keys),
+    claiming their entry_keys so no other source scrapes the same article meanwhile. Entries another
+    source has claimed are skipped.
+    """
+    candidates = []
+    while pending and len(candidates) < count:
+        entry = pending.pop(0)
+        unposted = unposted_keys(entry, state)
+        if not unposted: continue
+        if not claim_keys(state, unposted[1]):
+            print(f"  [{source_name}] Already being processed for another source, skipping: {entry.title}")
+            continue
+        print(f"  [{source_name}] Found new item to process: {entry.title}")
+        candidates.append((entry, *unposted))
+    return candidates
+
+def release_candidates(state, candidates, item):
+    """Releases the keys take_candidates claimed for every candidate but the one that became item."""
+    for entry, link_to_check, entry_keys in candidates:
+        if item is None or item['entry'] is not entry: release_keys(state, entry_keys)
+
+def accept_scrape(source_name, source_info, candidate, content_data, fresh, state):
+    """Stores and records a scrape (fresh=False for cached content), then returns ready_item's verdict on it."""
+    entry, link_to_check, entry_keys = candidate
+    if fresh:
+        store_content(link_to_check, content_data)
+        record_scrape(source_name, source_info, entry, link_to_check, content_data)
+    return ready_item(source_name, source_info, entry, link_to_check, entry_keys, content_data, state)
+
+def scrape_first_ready(source_name, source_info, candidates, pending, state):
+    """
+    Scrapes the candidates at the same time and returns the work item of the first one accepted,
+    or None. Once one is accepted, the other scrapes are cancelled and their entries put back at
+    the front of pending, in order, for the next round. A scrape that still finishes is cached, so
+    that round does not download the page again. The keys of every candidate but the accepted one
+    are released.
+    """
+    cancel = threading.Event()
+    def fetch(entry, link_to_check):
+        content_data = cached_content(link_to_check)
+        if content_data: return content_data, False
+        return scrape_entry(entry, source_info, cancel), True
+
+    executor = ThreadPoolExecutor(max_workers=len(candidates), thread_name_prefix='scrape')
+    futures = {executor.submit(fetch, candidate[0], candidate[1]): candidate for candidate in candidates}
+    handled, item = set(), None
+    try:
+        for future in as_completed(futures):
+            handled.add(future)
+            item = accept_scrape(source_name, source_info, futures[future], *future.result(), state)
+            if item: break
+    finally:
+        cancel.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+        release_candidates(state, candidates, item)
+    for future, candidate in futures.items():
+        if future not in handled: future.add_done_callback(lambda f, link=candidate[1]: _store_late_scrape(link, f))
+    pending[:0] = [candidate[0] for future, candidate in futures.items() if future not in handled]
+    return item
+
+def _store_late_scrape(link_to_check, future):
+    """Done callback for a scrape_first_ready scrape that finished after its round was over."""
+    if future.cancelled() or future.exception() is not None: return
+    content_data, fresh = future.result()
+    if fresh: store_content(link_to_check, content_data)
+
+def finish_source(source_name, source_info, feed, state, retry_later=False):
+    """
+    Ends a source whose candidates ran out without a post. retry_later says an item failed at the
+    AI or Telegram stage, so its validators are dropped and the next run sees the full feed again.
+    """
+    if retry_later:
+        print(f"  [{source_name}] No item could be posted this run; its failed items are retried next run.")
+        state['feed_cache'].pop(source_info['url'], None)
+        return
+    print(f"  [{source_name}] No new, processable items found among its newest entries.")
+    # Only cache validators once nothing is left to post; after a post the
+    # next run still needs the full feed to reach the remaining entries.
+    remember_feed_validators(state['feed_cache'], source_info['url'], feed)
+
+def ai_budget_spent(source_name, source_info, state):
+    """
+    True once the run's AI time budget is used up, so a source stops scraping candidates no AI call
+    could analyse. Its validators are dropped so the next run sees the full feed again.
+    """
+    if not AI_TIME_BUDGET.exhausted(): return False
+    print(f"  [{source_name}] AI time budget for this run is used up; leaving its entries for the next run.")
+    state['feed_cache'].pop(source_info['url'], None)
+    return True
+
+def _process_source(source_name, source_info, feed, state, ai_queue):
+    """
+    Scrape stage for one source: walks its entries best first, scraping up to speculative_width
+    new ones at once, hands the first usable one to the AI stage and waits for the outcome.
+    Stops after one post.
+    """
+    print(f"--- Checking {source_name} (Type: {source_info['type']}) ---")
+    try:
+        potential_entries = candidate_entries(source_name, source_info, feed, state)
+        if potential_entries is None:
+            return
+        if ai_budget_spent(source_name, source_info, state):
+            return
+        scraper = SCRAPERS.get(source_info.get('type'), {})
+        if 'prefetch' in scraper: scraper['prefetch'](potential_entries, state, scraper)
+
+        pending, width = list(potential_entries), speculative_width(source_info)
+        retry_later = False  # An item failed at the AI or Telegram stage, not for good
+        while True:
+            if ai_budget_spent(source_name, source_info, state):
+                break
+            candidates = take_candidates(source_name, pending, state, width)
+            if not candidates:
+                finish_source(source_name, source_info, feed, state, retry_later)
+                break
+            item = scrape_first_ready(source_name, source_info, candidates, pending, state)
+            if not item:
+                continue
+            item['outcome'] = Future()
+            ai_queue.put(item)
+            posted = item['outcome'].result()
+            release_keys(state, item['dedup_keys'])
+            if posted:
+                break
+            retry_later = True
+    except Exception as e:
+        print(f"!! FATAL ERROR processing feed for {source_name}. Error: {e}")
+
+def format_item_message(item):
+    """Formats the Telegram message for an item from its item['ai_data']. Returns None without one."""
+    entry, source_name, source_info = item['entry'], item['source_name'], item['source_info']
+    if not item.get('ai_data'): return None
+    if source_info['post_format'] == 'scientific_paper':
+        return format_paper_telegram_message(entry.title, source_name, source_info, item['ai_data'], entry.link)
+    if source_info['post_format'] == 'scientific_news':
+        doi_link = item['content_data'].get('doi_link')
+        return format_news_telegram_message(entry.title, source_name, source_info, item['ai_data'], entry.link, doi_link=doi_link)
+    return None
+
+def analyse_item(item):
+    """AI stage for one scraped item. Returns the formatted Telegram message, or None."""
+    full_text = item['content_data'].get('text')
+    post_format = item['source_info']['post_format']
+
+    # *** KEY CHANGE: CALLING THE NEW DISPATCHER FUNCTIONS ***
+    if post_format == 'scientific_paper':
+        item['ai_data'] = get_ai_paper_analysis(full_text) # Replaced old call
+    elif post_format == 'scientific_news':
+        item['ai_data'] = get_ai_news_analysis(full_text) # Replaced old call
+    return format_item_message(item)
+
+def analyse_items(items):
+    """
+    AI stage for several scraped items at once. Items with the same post format share batched
+    requests (get_ai_batch_analysis); the rest, and any without a valid batched answer, go
+    through analyse_item one by one. Returns the formatted message (or None) for each item.
+    """
+    by_analysis = {}
+    for item in items:
+        prompt_name = POST_FORMAT_ANALYSES.get(item['source_info']['post_format'])
+        text = item['content_data'].get('text')
+        if prompt_name and text and len(text) >= AI_ANALYSES[prompt_name]['min_chars']:
+            by_analysis.setdefault(prompt_name, []).append(item)
+    for prompt_name, batch in by_analysis.items():
+        if len(batch) < 2: continue
+        try:
+            answers = get_ai_batch_analysis(prompt_name, [item['content_data']['text'] for item in batch])
+        except Exception as e:
+            print(f"  Error during batched AI analysis: {e}")
+            continue
+        for item, ai_data in zip(batch, answers):
+            if ai_data: item['ai_data'] = ai_data
+
+    messages = []
+    for item in items:
+        try:
+            messages.append(format_item_message(item) if item.get('ai_data') else analyse_item(item))
+        except Exception as e:
+            print(f"  Error during AI analysis for '{item['entry'].title}': {e}")
+            messages.append(None)
+    return messages
+
+def _next_ai_batch(ai_queue, collect_lock):
+    """
+    Takes the next item from ai_queue plus up to AI_BATCH_SIZE - 1 more that arrive within
+    AI_BATCH_WAIT_SECONDS. Returns (items, stop), where stop means the queue's end marker was reached.
+    Workers collect one at a time under collect_lock, so items that arrive together stay together.
+    """
+    with collect_lock:
+        items = [ai_queue.get()]
+        if items[0] is None: return [], True
+        deadline = time.monotonic() + AI_BATCH_WAIT_SECONDS
+        while len(items) < AI_BATCH_SIZE:
+            try: item = ai_queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty: break
+            if item is None: return items, True
+            items.append(item)
+        return items, False
+
+def _ai_worker(ai_queue, send_queue, collect_lock):
+    stop = False
+    while not stop:
+        items, stop = _next_ai_batch(ai_queue, collect_lock)
+        for item, message in zip(items, analyse_items(items)):
+            item['message'] = message
+            if item['message']:
+                send_queue.put(item)
+            else:
+                print(f"  [{item['source_name']}] Skipping post due to AI/formatting failure.")
+                item['outcome'].set_result(False)
+
+def record_post(item, state):
+    """Marks a sent item as posted in the group's history and the global dedup index."""
+    state['posted_links'].add(item['link_to_check'])
+    CONTENT_CACHE.delete(item['link_to_check'])
+    append_posted_link(state['group']['posted_links_file'], item['entry'].link)
+    with state['lock']:
+        record_dedup_keys(state['global_index'], item['dedup_keys'])
+    state['new_links_found'] = True
+
+def _send_worker(send_queue, state):
+    """Telegram stage. Runs on a single thread, so posts go out one at a time and records are never raced."""
+    while True:
+        item = send_queue.get()
+        if item is None:
+            return
+        try:
+            image_url = item['content_data'].get('image_url')
+            sent = send_to_telegram(item['message'], image_url=image_url)
+            if sent: record_post(item, state)
+            item['outcome'].set_result(sent)
+        except Exception as e:
+            print(f"  Error posting '{item['entry'].title}': {e}")
+            item['outcome'].set_result(False)
+
+def new_group_state(group, global_index, feed_cache, claimed=None, lock=None):
+    """
+    Builds the state one group's run shares between its stages. Groups that run at the
+    same time pass the same claimed set and lock so they cannot claim the same article.
+    """
+    return {
+        'group': group,
+        'posted_links': {canonical_url(link) for link in load_posted_links(group['posted_links_file'])},
+        'global_index': global_index,
+        'feed_cache': feed_cache,
+        'claimed': claimed if claimed is not None else set(),
+        'lock': lock or threading.Lock(),
+        'new_links_found': False,
+    }
+
+def process_feeds(group, global_index):
+    """
+    Runs one source group through a three-stage pipeline connected by bounded queues:
+    scrape (PIPELINE_SCRAPE_WORKERS sources at once) -> AI (PIPELINE_AI_WORKERS) -> Telegram (one sender).
+    Scraping for one source overlaps with AI analysis for another, and each source still
+    posts at most one item.
+    """
+    sources = group['sources']
+    feed_cache = load_feed_cache(group['feed_cache_file'])
+    source_names = list(sources.keys())
+    random.shuffle(source_names)
+    feeds = fetch_all_feeds(sources, source_names, feed_cache)
+
+    state = new_group_state(group, global_index, feed_cache)
+    ai_queue = queue.Queue(maxsize=max(1, PIPELINE_QUEUE_SIZE))
+    send_queue = queue.Queue(maxsize=max(1, PIPELINE_QUEUE_SIZE))
+    collect_lock = threading.Lock()
+    ai_threads = [
+        threading.Thread(target=_ai_worker, args=(ai_queue, send_queue, collect_lock), daemon=True)
+        for _ in range(max(1, PIPELINE_AI_WORKERS))
+    ]
+    send_thread = threading.Thread(target=_send_worker, args=(send_queue, state), daemon=True)
+    for thread in ai_threads + [send_thread]: thread.start()
+
+    with ThreadPoolExecutor(max_workers=max(1, PIPELINE_SCRAPE_WORKERS)) as executor:
+        for source_name in source_names:
+            executor.submit(_process_source, source_name, sources[source_name], feeds[source_name], state, ai_queue)
+
+    for _ in ai_threads: ai_queue.put(None)
+    for thread in ai_threads: thread.join()
+    send_queue.put(None)
+    send_thread.join()
+
+    save_feed_cache(group['feed_cache_file'], feed_cache)
+    if not state['new_links_found']:
+        print("\n--- No new posts were made in this run. ---")
+
+def check_api_keys():
+    """Final check for API keys before running. Returns False (after printing why) if one is missing."""
+    chain = ai_provider_chain()
+    if not chain:
+        print(f"FATAL ERROR: No API key is set for AI_PROVIDER '{AI_PROVIDER}' or any of {AI_FALLBACK_PROVIDERS}.")
+        return False
+    if chain[0] != AI_PROVIDER:
+        print(f"WARNING: No API key for AI_PROVIDER '{AI_PROVIDER}'; using {' -> '.join(chain)}.")
+    return True
+
+def run_groups(group_names):
+    """
+    Runs process_feeds for each named group, one after another, in this process.
+    All groups share the same HTTP session, AI configuration and global dedup index.
+    """
+    global_index = load_global_index()
+    try:
+        send_pending_telegram_steps()
+        for group_name in group_names:
+            print(f"\n========== Source group: {group_name} ==========")
+            try:
+                process_feeds(load_source_group(group_name), global_index)
+            except Exception as e:
+                print(f"!! FATAL ERROR running source group {group_name}. Error: {e}")
+    finally:
+        save_caches()
+
+def save_caches():
+    """Writes the run-wide local caches back to disk."""
+    CONTENT_CACHE.save()
+    LLM_CACHE.save()
+    CROSSREF_CACHE.save()
+    SCRAPE_HISTORY.save()
+    ROBOTS_CACHE.save()
+    TELEGRAM_FILE_IDS.save()
+    TELEGRAM_PENDING.save()
@@ -0,0 +1,32 @@
+import argparse
+
+import engine
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Post new science articles from one or more source groups to Telegram.")
+    parser.add_argument('groups', nargs='*', help="Source groups to run (names of files in sources/). Default: all groups.")
+    parser.add_argument('--engine', choices=('sync', 'async'), default='sync',
+                        help="sync: thread pipeline, one group after another. async: every group on one asyncio loop (needs aiohttp).")
+    args = parser.parse_args()
+
+    available = engine.list_source_groups()
+    group_names = args.groups or available
+    unknown = [name for name in group_names if name not in available]
+    if unknown:
+        parser.error(f"unknown source group(s): {', '.join(unknown)}. Available: {', '.join(available)}")
+
+    if args.engine == 'async':
+        import async_engine
+        if not async_engine.is_available():
+            parser.error("--engine async needs the aiohttp package (pip install aiohttp)")
+        runner = async_engine.run_groups
+    else:
+        runner = engine.run_groups
+
+    if engine.check_api_keys():
+        runner(group_names)
+
+
+if __name__ == "__main__":
+    main()